@@ -0,0 +1,85 @@
+"""
+Compare retrieval latency between the HTTP and embedded (persistent) Chroma
+modes. The same random vectors are seeded into a Chroma server and into a
+temporary on-disk store, then VectorRetriever.search is timed against each.
+
+Run from the repository root with a Chroma server listening:
+
+    python -m benchmarks.chroma_modes --host localhost --port 8000
+"""
+import argparse
+from dataclasses import replace
+import tempfile
+import time
+
+import numpy as np
+
+from src.services.retrieval import VectorRetriever, create_client
+from src.utils.config import Config
+
+COLLECTION = "benchmark"
+
+
+def seed(client, vectors: np.ndarray) -> None:
+    if COLLECTION in [c.name for c in client.list_collections()]:
+        client.delete_collection(COLLECTION)
+    collection = client.create_collection(COLLECTION)
+
+    for start in range(0, len(vectors), 1000):
+        batch = vectors[start : start + 1000]
+        collection.add(
+            ids=[str(start + i) for i in range(len(batch))],
+            embeddings=batch.tolist(),
+            documents=[f"document {start + i}" for i in range(len(batch))],
+            metadatas=[{"title": f"title {start + i}"} for i in range(len(batch))],
+        )
+
+
+def measure(retriever: VectorRetriever, queries: np.ndarray) -> np.ndarray:
+    # warm up connections and index caches
+    for query in queries[:10]:
+        retriever.search(query.tolist())
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search(query.tolist())
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.documents, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, args.documents, args.queries)]
+
+    config = Config.get().chromadb
+    with tempfile.TemporaryDirectory() as path:
+        modes = {
+            "http": replace(config, mode="http", host=args.host, port=args.port),
+            "persistent": replace(config, mode="persistent", path=path),
+        }
+
+        print(f"{'mode':<12}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+        for mode, mode_config in modes.items():
+            client = create_client(mode_config)
+            seed(client, vectors)
+            timings = measure(VectorRetriever(client, COLLECTION, args.k), queries)
+            client.delete_collection(COLLECTION)
+
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            print(f"{mode:<12}{timings.mean():>9.2f}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cold start of the service: the cost of importing the app module, and the
+time from spawning a server until it is live (/healthz) and ready (/readyz).
+Ready needs the configured Chroma and embedding provider to be reachable.
+
+Run from the repository root:
+
+    python -m benchmarks.cold_start --runs 3 --imports 15
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from .loadtest import free_port
+
+
+def import_time(top: int) -> float:
+    """
+    Import the app module in a fresh interpreter, printing the heaviest
+    imports.
+
+    :param top: Number of imports to print
+    :returns: Seconds spent importing the app module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.app"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # import time: self [us] | cumulative | imported package
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            self_us, cumulative, indent, name = match.groups()
+            rows.append((int(cumulative), len(indent), name))
+
+    total = next(us for us, _, name in rows if name == "src.app")
+    if top:
+        print(f"{'cumulative ms':>14}  module")
+        top_level = [row for row in rows if row[1] <= 2]
+        for us, indent, name in sorted(top_level, reverse=True)[:top]:
+            print(f"{us / 1000:>14.1f}  {' ' * indent}{name}")
+        print()
+    return total / 1e6
+
+
+def serve_once(timeout: float) -> Dict[str, Optional[float]]:
+    """
+    Spawn a server and poll the probes until it is ready.
+
+    :param timeout: Seconds to wait for readiness
+    :returns: Seconds from spawning to live and to ready
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.app:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    times = {"live": None, "ready": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - start < timeout:
+                probe = "live" if times["live"] is None else "ready"
+                path = "/healthz" if probe == "live" else "/readyz"
+                try:
+                    if client.get(path).status_code == 200:
+                        times[probe] = time.perf_counter() - start
+                        if probe == "ready":
+                            break
+                        continue
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--imports", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    print(f"import src.app: {import_time(args.imports) * 1000:.0f} ms")
+
+    runs = [serve_once(args.timeout) for _ in range(args.runs)]
+    for probe in ("live", "ready"):
+        times = [run[probe] for run in runs if run[probe] is not None]
+        median = f"{statistics.median(times) * 1000:.0f} ms" if times else "n/a"
+        print(f"{probe:<6} median {median} ({len(times)}/{len(runs)} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Deterministic local stand-ins for the LLM, the embedding model and Chroma,
+with injectable latency. Nothing here touches the network, so a pipeline
+built from them runs on a laptop offline.
+"""
+import asyncio
+from collections import defaultdict
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List
+
+import chromadb
+from chromadb.config import Settings
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from langchain.schema.embeddings import Embeddings
+import numpy as np
+import tiktoken
+
+from chroma.script import SEED, Stats, chunk_documents, stream_documents
+from src.services.pipeline import Pipeline
+from src.services.providers import embedding_id
+from src.services.retrieval import VectorRetriever
+from src.utils.config import GlobalConfig
+
+# byte-level tokenizer, no BPE ranks to download
+OFFLINE_ENCODING = tiktoken.Encoding(
+    name="offline",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+
+
+class StageRecorder:
+    """
+    Collects per-stage durations reported by the stand-ins.
+    """
+
+    def __init__(self) -> None:
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[stage].append(seconds * 1000)
+
+    def summary(self) -> dict:
+        """
+        :returns: count, mean and p50/p95/p99 in milliseconds per stage
+        """
+        summary = {}
+        for stage, durations in self.durations.items():
+            values = np.array(durations)
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[stage] = {
+                "count": len(values),
+                "mean": values.mean(),
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+            }
+        return summary
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings. Texts sharing words get similar vectors,
+    so retrieval and the semantic cache behave plausibly.
+    """
+
+    def __init__(
+        self, dim: int = 256, latency: float = 0.0, recorder: StageRecorder = None
+    ) -> None:
+        self.dim = dim
+        self.latency = latency
+        self.recorder = recorder
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        vectors = [self._embed(text) for text in texts]
+        if self.recorder is not None:
+            self.recorder.record("embed", time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        vectors = [self._embed(text) for text in texts]
+        if self.recorder is not None:
+            self.recorder.record("embed", time.perf_counter() - start)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with a fixed sentence after `latency` seconds, then
+    `token_latency` seconds per token when streaming.
+    """
+
+    answer: str = "Power flickers are brief interruptions usually caused by weather."
+    latency: float = 0.0
+    token_latency: float = 0.0
+    streaming: bool = False
+    recorder: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.answer))]
+        )
+
+    def _generate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        time.sleep(self.latency + self.token_latency * len(self.answer.split()))
+        return self._result()
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+
+        for i, word in enumerate(self.answer.split()):
+            await asyncio.sleep(self.token_latency)
+            if self.streaming and run_manager is not None:
+                await run_manager.on_llm_new_token(word if i == 0 else f" {word}")
+
+        if self.recorder is not None:
+            self.recorder.record("llm", time.perf_counter() - start)
+        return self._result()
+
+
+class SlowRetriever(VectorRetriever):
+    """
+    VectorRetriever adding a blocking delay to every query, standing in for
+    the network round trip to a Chroma server.
+    """
+
+    def __init__(
+        self, *args, latency: float = 0.0, recorder: StageRecorder = None, **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.recorder = recorder
+
+    def search_many(self, vectors: List[List[float]]):
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        batches = super().search_many(vectors)
+        if self.recorder is not None:
+            self.recorder.record("retrieve", time.perf_counter() - start)
+        return batches
+
+
+def seeded_client(config: GlobalConfig, embeddings: Embeddings) -> chromadb.ClientAPI:
+    """
+    In-memory Chroma client holding the repository seed data.
+
+    :param config: GlobalConfig object, selects the collection name
+    :param embeddings: Embeddings used to index the documents
+    :returns: Chroma client
+    """
+    client = chromadb.EphemeralClient(
+        Settings(anonymized_telemetry=False, allow_reset=True)
+    )
+    client.reset()
+    collection = client.create_collection(
+        config.chromadb.collection,
+        metadata={"embedding": embedding_id(config.embeddings)},
+    )
+
+    chunks = list(
+        {
+            chunk.id: chunk
+            for chunk in chunk_documents(
+                stream_documents(SEED), OFFLINE_ENCODING, 2048, Stats()
+            )
+        }.values()
+    )
+    collection.add(
+        ids=[chunk.id for chunk in chunks],
+        documents=[chunk.text for chunk in chunks],
+        metadatas=[chunk.metadata for chunk in chunks],
+        embeddings=embeddings.embed_documents([chunk.text for chunk in chunks]),
+    )
+    return client
+
+
+def fake_pipeline(
+    config: GlobalConfig,
+    recorder: StageRecorder,
+    embed_latency: float = 0.0,
+    retrieve_latency: float = 0.0,
+    llm_latency: float = 0.0,
+    token_latency: float = 0.0,
+) -> Pipeline:
+    """
+    Build a Pipeline from the configuration with every backend replaced by a
+    local stand-in.
+
+    :param config: GlobalConfig object
+    :param recorder: StageRecorder collecting per-stage durations
+    :param embed_latency: Seconds added to every embedding call
+    :param retrieve_latency: Seconds added to every Chroma query
+    :param llm_latency: Seconds before the LLM starts answering
+    :param token_latency: Seconds per generated token
+    :returns: Pipeline object
+    """
+    chroma = seeded_client(config, FakeEmbeddings())
+
+    llm_kwargs = dict(
+        latency=llm_latency, token_latency=token_latency, recorder=recorder
+    )
+    pipeline = Pipeline.from_components(
+        config,
+        chroma=chroma,
+        embedding_model=FakeEmbeddings(latency=embed_latency, recorder=recorder),
+        llm=FakeChatModel(**llm_kwargs),
+        stream_llm=FakeChatModel(**llm_kwargs, streaming=True),
+        encoding=OFFLINE_ENCODING,
+    )
+    pipeline.retriever = SlowRetriever(
+        chroma,
+        config.chromadb.collection,
+        config.langchain.retrieval,
+        embedding=embedding_id(config.embeddings),
+        latency=retrieve_latency,
+        recorder=recorder,
+    )
+    return pipeline
@@ -0,0 +1,233 @@
+"""
+Replay a JSONL workload against the chat endpoints and report latency,
+throughput and a per-stage breakdown. By default every backend is replaced
+by a deterministic local stand-in with injectable latency, so runs are
+repeatable and need no network.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest --concurrency 32 --requests 500
+    python -m benchmarks.loadtest --mode http --baseline results/before.json
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import json
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+import numpy as np
+import uvicorn
+
+from benchmarks.fakes import StageRecorder, fake_pipeline
+from src.app import app, include_api
+from src.services.admission import AdmissionController
+from src.services.health import Startup
+from src.utils.config import Config
+
+WORKLOAD = Path(__file__).parent / "workload.jsonl"
+RESULTS = Path(__file__).parent / "results"
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    array = np.array(values)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {"mean": array.mean(), "p50": p50, "p95": p95, "p99": p99}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port: int) -> uvicorn.Server:
+    """
+    Serve the app over real HTTP from a background thread. Lifespan is off
+    so the startup hook does not replace the stand-in pipeline.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(app, port=port, lifespan="off", log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def request(
+    client: httpx.AsyncClient, endpoint: str, body: dict
+) -> tuple[int, float, Optional[float]]:
+    """
+    :returns: status code, total latency and time to first byte in ms
+    """
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", endpoint, json=body) as response:
+        async for _ in response.aiter_raw():
+            if first is None:
+                first = (time.perf_counter() - start) * 1000
+    return response.status_code, (time.perf_counter() - start) * 1000, first
+
+
+async def replay(args: argparse.Namespace, client: httpx.AsyncClient) -> dict:
+    with open(args.workload) as f:
+        workload = [json.loads(line) for line in f if line.strip()]
+    bodies = [workload[i % len(workload)] for i in range(args.requests)]
+    endpoint = "/api/chat/stream" if args.endpoint == "stream" else "/api/chat"
+
+    latencies, ttfb, errors, shed = [], [], 0, 0
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+
+    async def worker():
+        nonlocal errors, shed
+        while not queue.empty():
+            body = queue.get_nowait()
+            try:
+                status, latency, first = await request(client, endpoint, body)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if status == 503:
+                shed += 1
+            if status != 200:
+                errors += 1
+            latencies.append(latency)
+            if first is not None:
+                ttfb.append(first)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - start
+
+    stats = (await client.get("/api/stats")).json()
+    return {
+        "requests": len(bodies),
+        "errors": errors,
+        "shed": shed,
+        "duration_s": duration,
+        "throughput_rps": len(bodies) / duration,
+        "latency_ms": percentiles(latencies),
+        "ttfb_ms": percentiles(ttfb),
+        "stats": stats,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    recorder = StageRecorder()
+    server = None
+
+    if args.url is None:
+        # served without lifespan, stand in for the background startup
+        include_api()
+        startup = app.state.startup = Startup()
+        # load shedding as configured, a single load generator would only
+        # measure its own rate limit
+        admission = Config.get().admission
+        app.state.rate_limiter = None
+        app.state.admission = (
+            AdmissionController(
+                admission.max_active, admission.max_queue, admission.max_wait
+            )
+            if admission.enabled
+            else None
+        )
+        app.state.pipeline = startup.pipeline = fake_pipeline(
+            Config.get(),
+            recorder,
+            embed_latency=args.embed_latency / 1000,
+            retrieve_latency=args.retrieve_latency / 1000,
+            llm_latency=args.llm_latency / 1000,
+            token_latency=args.token_latency / 1000,
+        )
+
+    if args.url is not None:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    elif args.mode == "http":
+        port = free_port()
+        server = serve(port)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        client = httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits
+        )
+    else:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+    async with client:
+        results = await replay(args, client)
+
+    if server is not None:
+        server.should_exit = True
+    results["stages_ms"] = recorder.summary()
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\n{'metric':<18}{'baseline':>12}{'current':>12}{'change':>10}")
+    rows = [("throughput_rps", baseline["throughput_rps"], results["throughput_rps"])]
+    for key in ("p50", "p95", "p99"):
+        rows.append(
+            (f"latency {key}", baseline["latency_ms"][key], results["latency_ms"][key])
+        )
+    for name, before, after in rows:
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<18}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", type=Path, default=WORKLOAD)
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument(
+        "--url", default=None, help="benchmark a running server instead of stand-ins"
+    )
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--embed-latency", type=float, default=20, help="ms")
+    parser.add_argument("--retrieve-latency", type=float, default=10, help="ms")
+    parser.add_argument("--llm-latency", type=float, default=300, help="ms")
+    parser.add_argument("--token-latency", type=float, default=5, help="ms")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = {"args": {k: str(v) for k, v in vars(args).items()}}
+    results.update(asyncio.run(run(args)))
+
+    print(
+        f"{results['requests']} requests, {results['errors']} errors "
+        f"({results['shed']} shed), "
+        f"{results['throughput_rps']:.1f} req/s"
+    )
+    for name in ("latency_ms", "ttfb_ms"):
+        if results[name]:
+            values = "  ".join(f"{k} {v:.1f}" for k, v in results[name].items())
+            print(f"{name:<12}{values}")
+    for stage, summary in results["stages_ms"].items():
+        values = "  ".join(f"{k} {v:.1f}" for k, v in summary.items())
+        print(f"  {stage:<10}{values}")
+
+    output = args.output or RESULTS / (
+        f"loadtest-{args.mode}-{args.endpoint}-"
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, default=float))
+    print(f"results written to {output}")
+
+    if args.baseline is not None:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
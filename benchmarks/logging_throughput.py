@@ -0,0 +1,152 @@
+"""
+Logging throughput of the previous logging setup against the current text
+and production (JSON lines, background writer, debug sampling) setups.
+
+Every setup logs to a temporary file standing in for stderr. The rate is
+measured on the calling side, which is what the event loop pays. The time
+the background writer needs to drain its queue is reported separately.
+
+Run from the repository root:
+
+    python -m benchmarks.logging_throughput --records 20000
+"""
+import argparse
+import inspect
+import logging
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from src.utils.logging import LoggerStream, construct_logger, request_id
+
+
+class LegacyLoggerStream(LoggerStream):
+    """
+    LoggerStream as it was, walking the stack on every write.
+    """
+
+    def write(self, message: str) -> None:
+        if message := message.rstrip():
+            frame = inspect.currentframe()
+            while frame:
+                frame = frame.f_back
+                if frame.f_globals["__name__"] != __name__:
+                    break
+            frame_info = {
+                "filename": frame.f_code.co_filename,
+                "line_no": frame.f_lineno,
+                "function": frame.f_code.co_name,
+            }
+            logger.bind(captured_frame_info=frame_info).opt(depth=1).log(
+                self.level, message
+            )
+
+
+class LegacyInterceptHandler(logging.Handler):
+    """
+    InterceptHandler as it was, walking the stack on every record.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        frame = logging.currentframe()
+        depth = 0
+        while frame:
+            if frame.f_code.co_filename in (logging.__file__, __file__):
+                frame = frame.f_back
+                depth += 1
+                continue
+            break
+
+        logger.opt(depth=depth, exception=record.exc_info).log(
+            level, record.getMessage()
+        )
+
+
+def legacy_format(record) -> str:
+    if "\n" in record["message"]:
+        format_string = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>\n{message}</level>\n"
+    else:
+        format_string = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>\n"
+    return format_string
+
+
+def legacy() -> type:
+    logger.remove()
+    try:
+        logger.level("PRINT")
+    except ValueError:
+        logger.level("PRINT", no=25, color="<white>")
+    logging.basicConfig(handlers=[LegacyInterceptHandler()], level="DEBUG", force=True)
+    logger.add(sys.stderr, level="DEBUG", format=legacy_format)
+    return LegacyLoggerStream
+
+
+def text() -> type:
+    construct_logger(level="DEBUG")
+    return LoggerStream
+
+
+def production() -> type:
+    construct_logger(
+        level="DEBUG", format="json", queue_size=100_000, sampling={"DEBUG": 0.01}
+    )
+    return LoggerStream
+
+
+SETUPS = {"legacy": legacy, "text": text, "production": production}
+
+
+def workloads(stream_class: type) -> dict:
+    stdlib = logging.getLogger("benchmark")
+    stream = stream_class(level="PRINT")
+    return {
+        "loguru info": lambda i: logger.info("request {} handled", i),
+        "stdlib info": lambda i: stdlib.info("request %d handled", i),
+        "print": lambda i: stream.write(f"token {i}\n"),
+        "loguru debug": lambda i: logger.debug("token {} streamed", i),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=20000)
+    args = parser.parse_args()
+
+    request_id.set("0123456789abcdef")
+    stderr = sys.stderr
+    results = {}
+    for name, setup in SETUPS.items():
+        with tempfile.TemporaryFile("w+") as sink:
+            sys.stderr = sink
+            try:
+                for workload, log in workloads(setup()).items():
+                    start = time.perf_counter()
+                    for i in range(args.records):
+                        log(i)
+                    elapsed = time.perf_counter() - start
+
+                    # removing the sinks waits for the background writer
+                    drain = time.perf_counter()
+                    logger.remove()
+                    drain = time.perf_counter() - drain
+                    setup()
+
+                    results[name, workload] = (args.records / elapsed, drain)
+                logger.remove()
+            finally:
+                sys.stderr = stderr
+
+    print(f"{'setup':<12}{'workload':<14}{'records/s':>12}{'drain ms':>10}")
+    for (name, workload), (rate, drain) in results.items():
+        print(f"{name:<12}{workload:<14}{rate:>12,.0f}{drain * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Per-request overhead of the previous `app.middleware("http")` stack against
+the pure ASGI middleware, measured against an app without middleware.
+
+Apps are called directly through ASGI, no server or network is involved, so
+the difference is what the middleware costs. A streamed response also
+reports the time to its first body chunk, which the middleware must not
+delay.
+
+Run from the repository root:
+
+    python -m benchmarks.middleware_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from typing import Callable
+import uuid
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from src.common.exceptions import ServerException
+from src.common.middleware import CatchExceptionsMiddleware, RequestContextMiddleware
+from src.services.metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+from src.utils.logging import request_id
+from src.utils.metrics import Timings, current_timings
+
+
+async def legacy_catch_exceptions(request: Request, call_next: Callable) -> Response:
+    """
+    catch_exceptions_middleware as it was.
+    """
+    try:
+        return await call_next(request)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logging.exception(e)
+        raise ServerException("Internal Server Error")
+
+
+async def legacy_request_context(request: Request, call_next: Callable) -> Response:
+    """
+    request_context_middleware as it was.
+    """
+    rid = request.headers.get("X-Request-ID", "")
+    if not (0 < len(rid) <= 64 and rid.isprintable()):
+        rid = uuid.uuid4().hex
+    rid_token = request_id.set(rid)
+
+    timings = Timings()
+    token = current_timings.set(timings)
+    REQUESTS_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = timings.header()
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        current_timings.reset(token)
+        request_id.reset(rid_token)
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            timings.elapsed(),
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        )
+
+
+def build(stack: str, chunk_delay: float) -> FastAPI:
+    app = FastAPI()
+    if stack == "legacy":
+        app.middleware("http")(legacy_catch_exceptions)
+        app.middleware("http")(legacy_request_context)
+    elif stack == "asgi":
+        app.add_middleware(CatchExceptionsMiddleware)
+        app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        async def tokens():
+            for i in range(3):
+                yield f"data: token {i}\n\n"
+                await asyncio.sleep(chunk_delay)
+
+        return StreamingResponse(tokens(), media_type="text/event-stream")
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> float:
+    """
+    :returns: Seconds until the first non-empty body chunk was sent
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    start = time.perf_counter()
+    first = None
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # like a server, report the disconnect once the response is sent
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first
+        if message["type"] == "http.response.body":
+            if first is None and message.get("body"):
+                first = time.perf_counter() - start
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return first
+
+
+async def run(args) -> dict:
+    results = {}
+    for stack in ("bare", "legacy", "asgi"):
+        app = build(stack, args.chunk_delay)
+        for _ in range(200):
+            await call(app, "/ping")
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            await call(app, "/ping")
+        per_request = (time.perf_counter() - start) / args.requests
+
+        first_chunk = [await call(app, "/stream") for _ in range(args.streams)]
+        results[stack] = (per_request, statistics.median(first_chunk))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    bare = results["bare"][0]
+    print(f"{'stack':<8}{'µs/request':>12}{'overhead µs':>13}{'first chunk ms':>16}")
+    for stack, (per_request, first_chunk) in results.items():
+        print(
+            f"{stack:<8}{per_request * 1e6:>12.1f}{(per_request - bare) * 1e6:>13.1f}"
+            f"{first_chunk * 1000:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Serialization of a chat response as it was (model_dump, then the standard
+library encoder) against the one-step encoders, and the size and cost of
+compressing the result.
+
+Run from the repository root:
+
+    python -m benchmarks.serialization --sources 4 --chars 1500
+"""
+import argparse
+import gzip
+import json
+import time
+
+from src.common.responses import dumps, orjson
+from src.models.outputs import ChatResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def response(sources: int, chars: int) -> ChatResponse:
+    text = ("Power flickers are caused by momentary voltage drops. " * 40)[:chars]
+    return ChatResponse(
+        answer=text[:400],
+        sources=[
+            {
+                "page_content": text,
+                "metadata": {"source": f"https://example.com/{i}", "page": i},
+            }
+            for i in range(sources)
+        ],
+    )
+
+
+def rate(function, repeat: int) -> float:
+    """
+    :returns: Microseconds per call
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def stdlib(model: ChatResponse) -> bytes:
+    # what JSONResponse did
+    return json.dumps(
+        model.model_dump(), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--chars", type=int, default=1500)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    model = response(args.sources, args.chars)
+    encoders = {
+        "stdlib": lambda: stdlib(model),
+        "model": lambda: dumps(model),
+        "dict": lambda: dumps(model.model_dump()),
+    }
+    print(
+        f"{'encoder':<10}{'µs':>10}  (dict uses {'orjson' if orjson else 'pydantic_core'})"
+    )
+    for name, encoder in encoders.items():
+        print(f"{name:<10}{rate(encoder, args.repeat):>10.1f}")
+
+    body = dumps(model)
+    compressors = {"gzip-1": lambda: gzip.compress(body, 1, mtime=0)}
+    compressors["gzip-6"] = lambda: gzip.compress(body, 6, mtime=0)
+    if brotli is not None:
+        compressors["br-4"] = lambda: brotli.compress(body, quality=4)
+    print(f"\n{'codec':<10}{'µs':>10}{'bytes':>10}  (identity {len(body)} bytes)")
+    for name, compress in compressors.items():
+        size = len(compress())
+        print(f"{name:<10}{rate(compress, args.repeat // 4):>10.1f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,422 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+import hashlib
+from itertools import islice
 import os
+from pathlib import Path
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
+import uuid
 
 import chromadb
-from chromadb.config import Settings
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 from dotenv import load_dotenv, find_dotenv
+from loguru import logger
 import yaml
 
+from src.services.context import encode, encoding_for
+from src.services.keywords import KeywordIndexBuilder
+from src.services.providers import check_embedding, create_embeddings, embedding_id
+from src.services.retrieval import (
+    collection_version,
+    create_client,
+    shard_configs,
+    shard_of,
+)
+from src.utils.config import Config, EmbeddingsConfig
+
 HOST = "localhost"
-PORT = "8000"
+PORT = 8000
+SEED = Path(__file__).parent / "seed.yaml"
+# input limit of the OpenAI embedding models
+OPENAI_MAX_TOKENS = 8191
+
+# character offsets where each token of a text starts
+Tokenize = Callable[[str], List[int]]
 
 
 load_dotenv(find_dotenv())
 
 
-def main():
-    chroma = chromadb.HttpClient(
-        host=HOST,
-        port=PORT,
-        settings=Settings(chroma_api_impl="chromadb.api.fastapi.FastAPI"),
+@dataclass
+class Chunk:
+    id: str
+    text: str
+    metadata: dict
+    tokens: int
+
+
+@dataclass
+class Stats:
+    documents: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    embedded: int = 0
+    tokens: int = 0
+    deleted: int = 0
+    start: float = field(default_factory=time.perf_counter)
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        logger.info(
+            f"{self.documents} documents, {self.chunks} chunks "
+            f"({self.embedded} embedded, {self.skipped} unchanged, "
+            f"{self.deleted} stale deleted) in {elapsed:.2f}s"
+        )
+        logger.info(
+            f"Throughput: {self.documents / elapsed:.1f} docs/s, "
+            f"{self.tokens / elapsed:.1f} tokens/s embedded"
+        )
+
+
+def stream_documents(path: Path) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield (key, document) pairs from the seed file one top-level entry at a
+    time, so the whole corpus is never held in memory.
+
+    :param path: Path to the seed YAML file
+    """
+    lines: List[str] = []
+    with open(path, "r") as f:
+        for line in f:
+            # a new top-level key starts at column zero
+            if lines and line[:1] not in (" ", "\t", "\n", "#"):
+                yield from (
+                    yaml.load("".join(lines), Loader=yaml.SafeLoader) or {}
+                ).items()
+                lines = []
+            lines.append(line)
+
+    if lines:
+        yield from (yaml.load("".join(lines), Loader=yaml.SafeLoader) or {}).items()
+
+
+def tokenizer_for(config: EmbeddingsConfig) -> Tuple[Tokenize, int]:
+    """
+    Tokenizer of the embedding model, and the most tokens of a text it embeds.
+    The provider truncates longer texts, so chunks must fit this limit.
+
+    :param config: Embeddings config
+    :returns: (tokenize, max tokens) pair
+    """
+    if config.provider == "onnx":
+        # only needed by this provider, imported when it is configured
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(
+            os.path.join(os.path.expanduser(config.onnx.path), "tokenizer.json")
+        )
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+
+        def tokenize(text: str) -> List[int]:
+            encoding = tokenizer.encode(text, add_special_tokens=False)
+            return [start for start, _ in encoding.offsets]
+
+        # truncation counts the special tokens added around every text
+        return tokenize, config.onnx.max_length - len(tokenizer.encode("").ids)
+
+    encoding = encoding_for(config.model)
+    return (
+        lambda text: encoding.decode_with_offsets(encode(encoding, text))[1],
+        OPENAI_MAX_TOKENS,
     )
 
-    openai_ef = OpenAIEmbeddingFunction(
-        api_key=os.environ["OPENAI_API_KEY"], model_name="text-embedding-ada-002"
+
+def split_body(
+    body: str, tokenize: Tokenize, max_tokens: int
+) -> Iterator[Tuple[str, int]]:
+    """
+    Split a document body into chunks of at most `max_tokens` tokens, packing
+    whole lines where possible.
+
+    :param body: Document body
+    :param tokenize: Tokenizer of the embedding model
+    :param max_tokens: Maximum number of tokens per chunk
+    :returns: iterator of (text, token count) pairs
+    """
+    lines: List[str] = []
+    size = 0
+    for line in filter(None, (line.strip() for line in body.splitlines())):
+        offsets = tokenize(line)
+        if size + len(offsets) > max_tokens and lines:
+            yield "\n".join(lines), size
+            lines, size = [], 0
+
+        # a single line longer than the budget is split on token boundaries
+        while len(offsets) > max_tokens:
+            cut = offsets[max_tokens]
+            yield line[:cut], max_tokens
+            line = line[cut:]
+            offsets = [offset - cut for offset in offsets[max_tokens:]]
+
+        if offsets:
+            lines.append(line)
+            size += len(offsets)
+
+    if lines:
+        yield "\n".join(lines), size
+
+
+def chunk_documents(
+    documents: Iterable[Tuple[str, dict]],
+    tokenize: Tokenize,
+    max_tokens: int,
+    stats: Stats,
+) -> Iterator[Chunk]:
+    """
+    Turn seed documents into chunks identified by a hash of their content, so
+    an unchanged chunk keeps its id across runs.
+
+    :param documents: Iterable of (key, document) pairs
+    :param tokenize: Tokenizer of the embedding model
+    :param max_tokens: Maximum number of tokens per chunk
+    :param stats: Stats object updated as documents are read
+    """
+    for key, document in documents:
+        stats.documents += 1
+        for i, (text, tokens) in enumerate(
+            split_body(document["body"], tokenize, max_tokens)
+        ):
+            digest = hashlib.sha256(
+                f"{document['title']}\0{document['link']}\0{text}".encode()
+            ).hexdigest()
+            yield Chunk(
+                id=digest,
+                text=text,
+                metadata=dict(
+                    title=document["title"],
+                    source=document["link"],
+                    document=key,
+                    chunk=i,
+                ),
+                tokens=tokens,
+            )
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_args() -> argparse.Namespace:
+    config = Config.get().chromadb
+    embeddings = Config.get().embeddings
+    keywords = Config.get().langchain.keywords
+
+    parser = argparse.ArgumentParser(
+        description="Incrementally seed the Chroma collection from a YAML file."
+    )
+    parser.add_argument("--mode", choices=["http", "persistent"], default=config.mode)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--path", default=config.path, help="store location in persistent mode"
+    )
+    parser.add_argument("--collection", default=config.collection)
+    parser.add_argument("--seed", type=Path, default=SEED)
+    parser.add_argument(
+        "--provider", choices=["openai", "onnx"], default=embeddings.provider
+    )
+    parser.add_argument("--model", default=embeddings.model)
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=512,
+        help="maximum tokens per chunk, capped to what the embedding model embeds",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="chunks per embedding call"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="embedding calls in flight"
     )
+    parser.add_argument(
+        "--keywords",
+        default=keywords.path if keywords.enabled else None,
+        help="where to write the keyword index, rebuilt on every run",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="drop the collection and re-embed everything",
+    )
+    return parser.parse_args()
+
+
+def open_shards(args: argparse.Namespace) -> List[List[chromadb.ClientAPI]]:
+    """
+    Clients of the replicas of every shard configured under `chromadb:`, or
+    of the single server or store selected on the command line.
+
+    :param args: Parsed command line arguments
+    :returns: Chroma clients per shard
+    """
+    config = replace(
+        Config.get().chromadb,
+        mode=args.mode,
+        host=args.host,
+        port=args.port,
+        path=args.path,
+    )
+    if config.shards:
+        return [
+            [create_client(replica) for replica in replicas]
+            for replicas in shard_configs(config)
+        ]
+    return [[create_client(config)]]
+
 
-    chroma.delete_collection("main")
-    collection = chroma.create_collection("main", embedding_function=openai_ef)
+def main():
+    args = parse_args()
+    stats = Stats()
+
+    # the same provider the API embeds queries with
+    config = replace(Config.get().embeddings, provider=args.provider, model=args.model)
+    embeddings = create_embeddings(config)
+    tokenize, limit = tokenizer_for(config)
+    chunk_tokens = args.chunk_tokens
+    if chunk_tokens > limit:
+        logger.warning(
+            f"--chunk-tokens {chunk_tokens} is more than {args.model} embeds, "
+            f"chunks are limited to {limit} tokens"
+        )
+        chunk_tokens = limit
+
+    clients = open_shards(args)
+    shards = []
+    for replicas in clients:
+        shards.append([])
+        for chroma in replicas:
+            names = [c.name for c in chroma.list_collections()]
+            if args.rebuild and args.collection in names:
+                chroma.delete_collection(args.collection)
+            collection = chroma.get_or_create_collection(args.collection)
+            # never mix vectors from different models in one collection
+            check_embedding(collection, embedding_id(config))
+            shards[-1].append(collection)
+    collections = [
+        (shard, collection)
+        for shard, replicas in enumerate(shards)
+        for collection in replicas
+    ]
+
+    def partition(items: Iterable, key: Callable) -> Dict[int, list]:
+        # documents are spread over the shards by a hash of their id
+        parts: Dict[int, list] = {}
+        for item in items:
+            parts.setdefault(shard_of(key(item), len(shards)), []).append(item)
+        return parts
+
+    def upsert(future: Future) -> None:
+        batch, embeddings = future.result()
+        for shard, part in partition(zip(batch, embeddings), lambda p: p[0].id).items():
+            for collection in shards[shard]:
+                collection.upsert(
+                    ids=[chunk.id for chunk, _ in part],
+                    embeddings=[embedding for _, embedding in part],
+                    documents=[chunk.text for chunk, _ in part],
+                    metadatas=[chunk.metadata for chunk, _ in part],
+                )
+        stats.embedded += len(batch)
+        stats.tokens += sum(chunk.tokens for chunk in batch)
+
+    seen: Set[str] = set()
+    pending: Set[Future] = set()
+    keywords = KeywordIndexBuilder()
+    chunks = chunk_documents(stream_documents(args.seed), tokenize, chunk_tokens, stats)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for batch in batched(chunks, args.batch_size):
+            ids = list(dict.fromkeys(chunk.id for chunk in batch))
+            # stored only once every replica of its shard holds it
+            existing = set(ids)
+            for shard, part in partition(ids, lambda id: id).items():
+                for collection in shards[shard]:
+                    found = set(collection.get(ids=part, include=[])["ids"])
+                    existing.difference_update(set(part) - found)
+            stats.chunks += len(batch)
 
-    with open("seed.yaml", "r") as f:
-        context = yaml.load(f, Loader=yaml.SafeLoader)
+            # skip chunks already stored or repeated earlier in this run
+            fresh = []
+            for chunk in batch:
+                if args.keywords:
+                    keywords.add(chunk.id, f"{chunk.metadata['title']}\n{chunk.text}")
+                if chunk.id not in existing and chunk.id not in seen:
+                    fresh.append(chunk)
+                seen.add(chunk.id)
+            stats.skipped += len(batch) - len(fresh)
+            if not fresh:
+                continue
+            batch = fresh
 
-    collection.add(
-        documents=[context[document]["body"] for document in context],
-        metadatas=[
-            dict(
-                title=context[document]["title"],
-                source=context[document]["link"],
+            # bound the number of embedding calls in flight
+            if len(pending) >= args.concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    upsert(future)
+
+            pending.add(
+                executor.submit(
+                    lambda batch: (
+                        batch,
+                        embeddings.embed_documents([chunk.text for chunk in batch]),
+                    ),
+                    batch,
+                )
             )
-            for document in context
-        ],
-        ids=[str(i) for i in range(len(context))],
+
+        for future in pending:
+            upsert(future)
+
+    # chunks gone from the seed file, or moved to another shard
+    stale = [
+        [
+            id
+            for id in collection.get(include=[])["ids"]
+            if id not in seen or shard_of(id, len(shards)) != shard
+        ]
+        for shard, collection in collections
+    ]
+
+    # bump the version so the API drops answers and search results cached
+    # against the old data, and stamp the provider so the API refuses to
+    # query with another one. Bumped before deleting, or the document count
+    # could come back to its old value under the old version. All
+    # collections get the same version and revision, so replicas agree
+    changed = stats.embedded or any(stale)
+    version = 1 + max(
+        int((collection.metadata or {}).get("version", 0))
+        for _, collection in collections
     )
+    revision = uuid.uuid4().hex
+    for _, collection in collections:
+        metadata = dict(collection.metadata or {})
+        metadata["embedding"] = embedding_id(config)
+        if changed:
+            metadata.update(version=version, revision=revision)
+        if metadata != (collection.metadata or {}):
+            collection.modify(metadata=metadata)
+
+    for (_, collection), ids in zip(collections, stale):
+        if ids:
+            collection.delete(ids=ids)
+            stats.deleted += len(ids)
+
+    # stamped with the final version, the API ignores it once the collection
+    # moves on. Same format as the retrievers' version
+    if args.keywords:
+        version = "|".join(
+            collection_version(replicas[0].get_collection(args.collection))
+            for replicas in clients
+        )
+        keywords.build(version).save(args.keywords)
+        logger.info(
+            f"Keyword index of {len(keywords.ids)} chunks written to {args.keywords}"
+        )
+
+    stats.report()
 
 
 if __name__ == "__main__":
@@ -1,33 +1,147 @@
+import asyncio
+import importlib
+import multiprocessing
+import signal
+import time
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from loguru import logger
+from starlette.exceptions import HTTPException
 
-from .common.handlers import validation_exception_handler
-from .common.middleware import catch_exceptions_middleware
-from .routes import core
+from .common.handlers import http_exception_handler, validation_exception_handler
+from .common.middleware import (
+    CatchExceptionsMiddleware,
+    CompressionMiddleware,
+    ProfilingMiddleware,
+    RequestContextMiddleware,
+    StartupMiddleware,
+)
+from .routes import admin, health
+from .services.admission import AdmissionController, RateLimiter
+from .services.health import Startup
+from .services.profiling import Profiler
 from .utils.config import Config
+from .utils.logging import construct_logger
 
+# keep this module light: langchain, chromadb and openai are imported by the
+# background startup, after the server accepts connections
 config = Config.get()
 
 app = FastAPI()
 
-app.middleware("http")(catch_exceptions_middleware)
+# pure ASGI middleware, the last one added is the outermost
+if config.compression.enabled:
+    app.add_middleware(CompressionMiddleware, config=config.compression)
+app.add_middleware(StartupMiddleware)
+app.add_middleware(CatchExceptionsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+# nothing is installed unless enabled, so disabled profiling has no overhead
+if config.profiling.enabled:
+    app.add_middleware(ProfilingMiddleware)
 
 cors_kwargs = config.cors_middleware.to_dict()
 app.add_middleware(CORSMiddleware, **cors_kwargs)
 
 # exception handlers
+app.add_exception_handler(HTTPException, http_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 
-# routers
-app.include_router(core.router, prefix="/api")
+# routers, the API routers are included by the background startup
+app.include_router(health.router)
+if config.profiling.enabled:
+    app.include_router(admin.router, prefix="/admin")
+
+
+def include_api() -> None:
+    """
+    Include the API routers. Importing them pulls in langchain, chromadb and
+    openai, which is left to the background startup.
+    """
+    from .routes import core, metrics
+
+    app.include_router(core.router, prefix="/api")
+    app.include_router(metrics.router)
+    # the schema may have been generated without them
+    app.openapi_schema = None
+
+
+async def prepare(startup: Startup) -> None:
+    """
+    Background startup: import the heavy dependencies, include the API
+    routers, build and warm up the pipeline. Blocking steps run in threads so
+    the health probes keep answering meanwhile. Requests to the API are
+    answered with a 503 until the pipeline is ready. Worker processes of a
+    multi-worker server wait for it before accepting connections.
+
+    :param startup: Startup object tracking the progress
+    """
+    try:
+        with startup.phase("import"):
+            await asyncio.to_thread(
+                importlib.import_module, ".routes.core", __package__
+            )
+        include_api()
+        from .services.pipeline import Pipeline
+
+        with startup.phase("build"):
+            pipeline = await asyncio.to_thread(Pipeline.from_config, config)
+        with startup.phase("warm_up"):
+            await pipeline.warm_up()
+    except Exception as e:
+        logger.exception(e)
+        startup.error = e
+        return
+
+    app.state.pipeline = startup.pipeline = pipeline
+    total = (time.perf_counter() - startup.started) * 1000
+    logger.info(f"Ready to serve {total:.1f} ms after startup")
 
 
 @app.on_event("startup")
 async def startup_event():
-    pass
+    # worker processes are spawned fresh, set their logging up again
+    worker = multiprocessing.parent_process() is not None
+    if worker:
+        construct_logger(**config.logging.to_dict())
+
+    startup = app.state.startup = Startup()
+    startup.task = asyncio.create_task(prepare(startup))
+
+    admission = config.admission
+    app.state.admission = app.state.rate_limiter = None
+    if admission.enabled:
+        app.state.admission = AdmissionController(
+            admission.max_active, admission.max_queue, admission.max_wait
+        )
+        if admission.rate_limit.enabled:
+            rate_limit = admission.rate_limit
+            app.state.rate_limiter = RateLimiter(
+                rate_limit.rate,
+                rate_limit.burst,
+                rate_limit.max_clients,
+                rate_limit.client_header,
+                rate_limit.trusted_hops,
+            )
+
+    if config.profiling.enabled:
+        profiler = app.state.profiler = Profiler(config.profiling)
+        # SIGUSR1 starts a default session, SIGUSR2 ends it early
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, profiler.begin)
+        loop.add_signal_handler(signal.SIGUSR2, profiler.end)
+
+    # workers share the listening socket and a worker accepts connections
+    # once its startup returns. A cold worker would answer 503 to requests
+    # warm workers could serve, so it only starts accepting when ready
+    if worker:
+        await startup.task
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    pass
+    startup = app.state.startup
+    startup.task.cancel()
+    if startup.pipeline is not None:
+        await startup.pipeline.close()
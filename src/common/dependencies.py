@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+from fastapi import Header, Request
+
+from ..models.inputs import BatchQuery
+from ..services.admission import AdmissionController, Rejected
+from ..services.health import Startup
+from ..services.profiling import Profiler
+from .exceptions import AuthException, RateLimitException, ServiceUnavailableException
+
+if TYPE_CHECKING:
+    from ..services.pipeline import Pipeline
+
+
+def get_pipeline(request: Request) -> Pipeline:
+    """
+    Dependency returning the pipeline built in the application startup hook.
+
+    :param request: Request object
+    :returns: Pipeline object
+    """
+    return request.app.state.pipeline
+
+
+def get_startup(request: Request) -> Startup:
+    """
+    Dependency returning the state of the background startup.
+
+    :param request: Request object
+    :returns: Startup object
+    """
+    return request.app.state.startup
+
+
+def get_profiler(
+    request: Request, x_profile_token: Optional[str] = Header(None)
+) -> Profiler:
+    """
+    Dependency returning the profiler once the caller presented the profiling
+    token in the `X-Profile-Token` header.
+
+    :param request: Request object
+    :param x_profile_token: Profiling token
+    :returns: Profiler object
+    """
+    profiler = request.app.state.profiler
+    if not profiler.authorized(x_profile_token):
+        raise AuthException(x_profile_token or "", "Invalid profiling token")
+    return profiler
+
+
+def _limit_rate(request: Request, cost: int) -> None:
+    limiter = request.app.state.rate_limiter
+    if limiter is None:
+        return
+    forwarded = None
+    if limiter.client_header is not None:
+        forwarded = request.headers.get(limiter.client_header)
+    peer = request.client.host if request.client is not None else None
+    try:
+        limiter.acquire(limiter.identify(forwarded, peer), cost)
+    except Rejected as e:
+        raise RateLimitException("Rate limit exceeded", e.retry_after)
+
+
+async def admit(request: Request) -> AsyncIterator[None]:
+    """
+    Dependency applying the client's rate limit, then holding an admission
+    slot until the response, streamed or not, has been sent.
+
+    :param request: Request object
+    :raises RateLimitException: if the client exceeded its rate
+    :raises ServiceUnavailableException: if the admission queue is full or
+        the wait for a slot timed out
+    """
+    _limit_rate(request, 1)
+    controller = request.app.state.admission
+    if controller is None:
+        yield
+        return
+    try:
+        async with controller.admit():
+            yield
+    except Rejected as e:
+        raise ServiceUnavailableException("Server is overloaded", e.retry_after)
+
+
+def admit_batch(request: Request, body: BatchQuery) -> Optional[AdmissionController]:
+    """
+    Dependency applying the client's rate limit to a batch, which costs one
+    token per query. No slot is held for the request itself, every answer
+    the batch generates takes its own admission slot instead.
+
+    :param request: Request object
+    :param body: BatchQuery object
+    :returns: AdmissionController object, None when admission is disabled
+    :raises RateLimitException: if the client exceeded its rate
+    """
+    _limit_rate(request, len(body.queries))
+    return request.app.state.admission
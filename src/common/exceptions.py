@@ -64,6 +64,29 @@ class AuthException(CustomHTTPException):
         )
 
 
+class NotFoundException(CustomHTTPException):
+    """
+    Exception class for resources that do not exist. Simplified shortcut
+    allows for proper output while only taking a string as input.
+    """
+
+    def __init__(self, value: str, msg: str) -> None:
+        """
+        :param value: Identifier of the missing resource
+        :param msg: Error message
+        """
+        error = ErrorDetail(
+            value=value,
+            msg=msg,
+            param="id",
+            location="path",
+        )
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            errors=[error],
+        )
+
+
 class BodyException(CustomHTTPException):
     """
     Exception class for body errors. This class is used to enforce the
@@ -115,3 +138,50 @@ class ServerException(CustomHTTPException):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             errors=[error],
         )
+
+
+class ServiceUnavailableException(CustomHTTPException):
+    """
+    Exception class for requests the service cannot take right now, e.g.
+    while it is starting. Simplified shortcut allows for proper output while
+    only taking a string as input. Clients are told when to retry through the
+    Retry-After header.
+    """
+
+    def __init__(self, msg: str, retry_after: int) -> None:
+        """
+        :param msg: Error message
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        error = ErrorDetail(
+            value="Service unavailable",
+            msg=msg,
+        )
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            errors=[error],
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class RateLimitException(CustomHTTPException):
+    """
+    Exception class for clients exceeding their request rate. Simplified
+    shortcut allows for proper output while only taking a string as input.
+    Clients are told when to retry through the Retry-After header.
+    """
+
+    def __init__(self, msg: str, retry_after: int) -> None:
+        """
+        :param msg: Error message
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        error = ErrorDetail(
+            value="Too many requests",
+            msg=msg,
+        )
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            errors=[error],
+            headers={"Retry-After": str(retry_after)},
+        )
@@ -1,7 +1,9 @@
-from fastapi import Request
+from fastapi import Request, Response
 from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
 
 from .exceptions import BodyException
+from .responses import error_response
 
 
 async def validation_exception_handler(
@@ -18,3 +20,18 @@ async def validation_exception_handler(
     """
     # reformat exception to match our error response format
     raise BodyException(exc)
+
+
+async def http_exception_handler(req: Request, exc: HTTPException) -> Response:
+    """
+    Handler for HTTPException. Renders the same `{"detail": ...}` body as
+    FastAPI's default handler, with the fast JSON encoder.
+
+    :param req: Request object
+    :param exc: HTTPException object
+    :returns: Response object
+    """
+    # these statuses must not have a body
+    if exc.status_code in {204, 304}:
+        return Response(status_code=exc.status_code, headers=exc.headers)
+    return error_response(exc)
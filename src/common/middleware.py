@@ -1,27 +1,309 @@
+import gzip
 import logging
-from typing import Callable
+import os
+import time
+from typing import Optional
+import uuid
 
-from fastapi import Request, Response, HTTPException
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from .exceptions import ServerException
+from ..services.metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT, STAGE_SECONDS
+from ..utils.config import CompressionConfig
+from ..utils.logging import request_id
+from ..utils.metrics import Timings, current_timings, timed
+from .exceptions import AuthException, ServerException, ServiceUnavailableException
+from .responses import error_response
 
+try:
+    import brotli
+except ImportError:  # optional, only gzip is offered without it
+    brotli = None
 
-async def catch_exceptions_middleware(
-    request: Request, call_next: Callable
-) -> Response:
+
+"""
+Pure ASGI middleware. Unlike `app.middleware("http")` functions, they run in
+the request's own task and pass response messages straight through, so they
+add no task, no stream copying and never buffer streamed bodies.
+"""
+
+
+class CatchExceptionsMiddleware:
     """
     Middleware designed to catch all unhandled exceptions and return a server
     error response. This is primarily made to be used when testing locally in
-    place of the Sentry middleware.
-
-    :param request: The request object
-    :param call_next: The next middleware in the chain
-    :return: The response object
-    """
-    try:
-        return await call_next(request)
-    except HTTPException as e:  # FastAPI HTTPException are expected behavior
-        raise e
-    except Exception as e:
-        logging.exception(e)
-        raise ServerException("Internal Server Error")
+    place of the Sentry middleware. HTTPExceptions escaping the exception
+    handlers (e.g. raised by a handler itself) are rendered as they would be
+    by FastAPI, anything else as a ServerException.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        :param app: The next ASGI application in the chain
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            # once headers are out the response can only be aborted
+            if started:
+                raise
+            if not isinstance(e, HTTPException):
+                logging.exception(e)
+                e = ServerException("Internal Server Error")
+            await error_response(e)(scope, receive, send)
+
+
+class RequestContextMiddleware:
+    """
+    Middleware setting up the per-request context. Every request gets a
+    correlation id, taken from the `X-Request-ID` header when the client sent
+    a usable one, which tags its log records and is echoed in the response.
+    Stages timed while handling the request are reported in a Server-Timing
+    header next to the total, and the time to the response headers is
+    observed in the request histogram.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        :param app: The next ASGI application in the chain
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = Headers(scope=scope).get("X-Request-ID", "")
+        if not (0 < len(rid) <= 64 and rid.isprintable()):
+            rid = uuid.uuid4().hex
+        timings = Timings()
+        observed = False
+
+        def observe(status: int) -> None:
+            nonlocal observed
+            observed = True
+            # route templates keep the label set bounded
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                timings.elapsed(),
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=status,
+            )
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Server-Timing"] = timings.header()
+                headers["X-Request-ID"] = rid
+                observe(message["status"])
+            await send(message)
+
+        rid_token = request_id.set(rid)
+        token = current_timings.set(timings)
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            current_timings.reset(token)
+            request_id.reset(rid_token)
+            if not observed:
+                observe(500)
+
+
+class StartupMiddleware:
+    """
+    Middleware answering requests with a 503 while the service starts in the
+    background, telling clients when to retry. The health probes are always
+    served.
+    """
+
+    def __init__(self, app: ASGIApp, exempt=("/healthz", "/readyz")) -> None:
+        """
+        :param app: The next ASGI application in the chain
+        :param exempt: Paths served while starting
+        """
+        self.app = app
+        self.exempt = exempt
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] == "http"
+            and not scope["app"].state.startup.ready
+            and scope["path"] not in self.exempt
+        ):
+            exception = ServiceUnavailableException("Service is starting", 1)
+            return await error_response(exception)(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware profiling requests while a profiling session is running, or a
+    single request sent with a valid `X-Profile` token header. Profiled
+    responses carry an `X-Profile` header with their wall and CPU times up to
+    the response headers. Only registered when profiling is enabled.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        :param app: The next ASGI application in the chain
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profiler = scope["app"].state.profiler
+        token = Headers(scope=scope).get("X-Profile")
+        if profiler.session is None and token is None:
+            return await self.app(scope, receive, send)
+
+        if token is not None and not profiler.authorized(token):
+            exception = AuthException(token, "Invalid profiling token")
+            return await error_response(exception)(scope, receive, send)
+
+        session = profiler.session.name if profiler.session is not None else None
+        recording = profiler.sampler.open() if token is not None else None
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profile: Optional[dict] = None
+        wall = time.perf_counter()
+        loop_cpu, cpu = time.thread_time(), time.process_time()
+
+        def stop(status: int) -> dict:
+            if recording is not None:
+                profiler.sampler.close(recording)
+            # loop CPU is spent on the event loop thread, process CPU adds the
+            # worker threads. Both include concurrent requests, profile alone
+            # for exact times
+            profile = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "wall_ms": (time.perf_counter() - wall) * 1000,
+                "loop_cpu_ms": (time.thread_time() - loop_cpu) * 1000,
+                "process_cpu_ms": (time.process_time() - cpu) * 1000,
+            }
+            profiler.observe(session, profile)
+            return profile
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal profile
+            if message["type"] == "http.response.start":
+                profile = stop(message["status"])
+                header = (
+                    f"wall={profile['wall_ms']:.1f}ms; "
+                    f"loop-cpu={profile['loop_cpu_ms']:.1f}ms; "
+                    f"cpu={profile['process_cpu_ms']:.1f}ms"
+                )
+                if recording is not None:
+                    header += f"; file={os.path.join(profiler.path, name)}.folded"
+                MutableHeaders(scope=message)["X-Profile"] = header
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profile is None:
+                profile = stop(500)
+            if recording is not None:
+                await profiler.write(name, recording, [profile])
+
+
+class CompressionMiddleware:
+    """
+    Middleware compressing complete responses of at least `minimum_size`
+    bytes, with brotli when installed and accepted by the client, else gzip.
+    Streamed responses are passed through as they are, compressing them
+    would hold tokens back in the compressor. Complete responses vary on
+    Accept-Encoding, and their strong ETag carries the negotiated encoding
+    even when the body is too small to be compressed.
+    """
+
+    def __init__(self, app: ASGIApp, config: CompressionConfig) -> None:
+        """
+        :param app: The next ASGI application in the chain
+        :param config: CompressionConfig object
+        """
+        self.app = app
+        self.config = config
+
+    def _encoding(self, scope: Scope) -> Optional[str]:
+        accepted = set()
+        header = Headers(scope=scope).get("Accept-Encoding", "")
+        for part in header.lower().replace(" ", "").split(","):
+            coding, _, quality = part.partition(";q=")
+            try:
+                if not quality or float(quality) > 0:
+                    accepted.add(coding)
+            except ValueError:
+                continue
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        with timed(STAGE_SECONDS, "compress"):
+            if encoding == "br":
+                return brotli.compress(body, quality=self.config.brotli_quality)
+            return gzip.compress(body, self.config.gzip_level, mtime=0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = self._encoding(scope)
+        start: Optional[Message] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # held back until the first body message shows the size
+                start = message
+                return
+            if start is None:
+                return await send(message)
+
+            start, message_start = None, start
+            headers = MutableHeaders(scope=message_start)
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and "Content-Encoding" not in headers
+            ):
+                # complete responses, 304s included, depend on Accept-Encoding
+                # whether or not this one ends up compressed
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is not None:
+                    # a strong ETag must differ between the representations
+                    # sent for each Accept-Encoding, so that a 304 carries the
+                    # tag of the 200 it revalidates
+                    if (etag := headers.get("ETag", "")).endswith('"'):
+                        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                    if len(body) >= self.config.minimum_size:
+                        body = self._compress(body, encoding)
+                        headers["Content-Encoding"] = encoding
+                        headers["Content-Length"] = str(len(body))
+                        message = {**message, "body": body}
+            await send(message_start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
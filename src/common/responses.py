@@ -1,5 +1,53 @@
-from fastapi import status
-from fastapi.responses import JSONResponse, PlainTextResponse
+import hashlib
+from typing import Any, Optional, Union
+
+from fastapi import HTTPException, Response, status
+from fastapi.responses import JSONResponse as BaseJSONResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+import pydantic_core
+
+try:
+    import orjson
+except ImportError:  # optional, pydantic_core encodes plain data otherwise
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize straight to UTF-8 JSON bytes. Pydantic models are encoded by
+    their compiled serializer in one step, without an intermediate dict.
+    Plain data goes through orjson when installed, else pydantic_core.
+
+    :param content: Pydantic model or JSON serializable data
+    :returns: Compact JSON bytes
+    """
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return pydantic_core.to_json(content)
+
+
+class JSONResponse(BaseJSONResponse):
+    """
+    JSONResponse rendered with the fast encoder, also accepting Pydantic
+    models as content.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def error_response(exception: HTTPException) -> JSONResponse:
+    """
+    :param exception: HTTPException to render
+    :returns: JSONResponse in the same format as FastAPI's HTTPException
+        handler
+    """
+    return JSONResponse(
+        {"detail": exception.detail}, exception.status_code, exception.headers
+    )
 
 
 class JSONResponseOK(JSONResponse):
@@ -7,9 +55,10 @@ class JSONResponseOK(JSONResponse):
     Shorthand for a JSONResponse with a 200 status code.
     """
 
-    def __init__(self, content: dict, headers=None, **kwargs) -> None:
+    def __init__(self, content: Union[dict, BaseModel], headers=None, **kwargs) -> None:
         """
-        :param content: JSON serializable content (as a positional arg)
+        :param content: JSON serializable content or Pydantic model (as a
+            positional arg)
         :param headers: Optional headers
         :param kwargs: Optional additional arguments
         """
@@ -18,6 +67,35 @@ class JSONResponseOK(JSONResponse):
         )
 
 
+def cacheable_response(
+    content: Any, if_none_match: Optional[str], max_age: int
+) -> Response:
+    """
+    JSON response that browsers and CDNs may cache for `max_age` seconds,
+    with a strong ETag derived from the body. When the client already holds
+    the same body, an empty 304 is returned instead.
+
+    :param content: JSON serializable content or Pydantic model
+    :param if_none_match: If-None-Match request header
+    :param max_age: Seconds the response may be cached
+    :returns: Response object
+    """
+    body = dumps(content)
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={max_age}"}
+
+    if if_none_match is not None:
+        # compression appends the coding to the tag, see CompressionMiddleware
+        tags = {
+            tag.strip().removeprefix("W/").strip('"').split("-")[0]
+            for tag in if_none_match.split(",")
+        }
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
+
+
 class PlainTextResponseOK(PlainTextResponse):
     """
     Shorthand for a PlainTextResponse with a 200 status code.
@@ -36,3 +114,78 @@ class PlainTextResponseOK(PlainTextResponse):
             media_type="text/plain",
             **kwargs,
         )
+
+
+class EventStreamResponseOK(StreamingResponse):
+    """
+    Shorthand for a Server-Sent Events StreamingResponse with a 200 status
+    code. Disables proxy buffering so events reach the client as they are
+    produced.
+    """
+
+    def __init__(self, content, headers=None, **kwargs) -> None:
+        """
+        :param content: Async iterator of formatted events (as a positional arg)
+        :param headers: Optional headers
+        :param kwargs: Optional additional arguments
+        """
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            **(headers or {}),
+        }
+        super().__init__(
+            status_code=status.HTTP_200_OK,
+            content=content,
+            headers=headers,
+            media_type="text/event-stream",
+            **kwargs,
+        )
+
+
+class NDJSONResponseOK(StreamingResponse):
+    """
+    Shorthand for a newline delimited JSON StreamingResponse with a 200
+    status code. Disables proxy buffering so lines reach the client as they
+    are produced.
+    """
+
+    def __init__(self, content, headers=None, **kwargs) -> None:
+        """
+        :param content: Async iterator of encoded lines (as a positional arg)
+        :param headers: Optional headers
+        :param kwargs: Optional additional arguments
+        """
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            **(headers or {}),
+        }
+        super().__init__(
+            status_code=status.HTTP_200_OK,
+            content=content,
+            headers=headers,
+            media_type="application/x-ndjson",
+            **kwargs,
+        )
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Format a single Server-Sent Event with a JSON payload.
+
+    :param event: Event name
+    :param data: JSON serializable payload or Pydantic model
+    :returns: Event string ready to be written to the stream
+    """
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+def format_line(data: Any) -> bytes:
+    """
+    Format a single newline delimited JSON line.
+
+    :param data: JSON serializable payload or Pydantic model
+    :returns: Line ready to be written to the stream
+    """
+    return dumps(data) + b"\n"
@@ -0,0 +1,34 @@
+from typing import Optional
+
+from fastapi import Response
+
+from ..common.responses import JSONResponseOK
+from ..services.profiling import Profiler
+
+
+async def start_profile(
+    requests: Optional[int], seconds: Optional[float], profiler: Profiler
+) -> Response:
+    """
+    Profiling controller. This controller is responsible for handling
+    requests to start a session at the /admin/profile route.
+
+    :param requests: Number of requests to profile
+    :param seconds: Number of seconds to profile
+    :param profiler: Profiler object built at application startup
+    :returns: JSONResponseOK object naming the running session
+    """
+    return JSONResponseOK({"session": profiler.begin(requests, seconds)})
+
+
+async def stop_profile(profiler: Profiler) -> Response:
+    """
+    Profiling controller. This controller is responsible for handling
+    requests to stop the session at the /admin/profile route.
+
+    :param profiler: Profiler object built at application startup
+    :returns: JSONResponseOK object naming the stopped session
+    """
+    session = profiler.session.name if profiler.session is not None else None
+    profiler.end()
+    return JSONResponseOK({"session": session})
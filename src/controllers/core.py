@@ -1,20 +1,191 @@
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
 from fastapi import Response
 from loguru import logger
 
 
-from ..common.responses import JSONResponseOK
-from ..models.inputs import Query
+from ..common.exceptions import (
+    NotFoundException,
+    ServerException,
+    ServiceUnavailableException,
+)
+from ..common.responses import (
+    EventStreamResponseOK,
+    JSONResponseOK,
+    NDJSONResponseOK,
+    cacheable_response,
+    format_event,
+    format_line,
+)
+from ..models.inputs import BatchQuery, Query
+from ..models.outputs import BatchResult, ChatResponse, SourceBatch
 from ..services import core as service
+from ..services.admission import AdmissionController, Rejected
+from ..services.metrics import STAGE_SECONDS
+from ..services.pipeline import Pipeline
+from ..utils.metrics import timed
 
 
-async def chat(body: Query) -> Response:
+async def chat(body: Query, pipeline: Pipeline) -> Response:
     """
     Text report agent controller. This controller is responsible for handling
     requests to the /agents/text route.
 
     :param body: CompanyQuery object
+    :param pipeline: Pipeline object built at application startup
     :returns: JSONResponseOK object for successful requests
     """
     logger.debug("Entering route at /agents/text...")
-    answer = await service.chat(body)
-    return JSONResponseOK(answer.model_dump())
+    answer = _present(await service.chat(body, pipeline), pipeline)
+    with timed(STAGE_SECONDS, "serialize"):
+        return JSONResponseOK(answer)
+
+
+async def chat_stream(body: Query, pipeline: Pipeline) -> Response:
+    """
+    Streaming chat controller. This controller is responsible for handling
+    requests to the /chat/stream route.
+
+    :param body: Query object
+    :param pipeline: Pipeline object built at application startup
+    :returns: EventStreamResponseOK object streaming tokens then sources
+    """
+    logger.debug("Entering route at /chat/stream...")
+    return EventStreamResponseOK(_events(service.chat_stream(body, pipeline), pipeline))
+
+
+async def chat_batch(
+    body: BatchQuery,
+    admission: Optional[AdmissionController],
+    pipeline: Pipeline,
+) -> Response:
+    """
+    Batch chat controller. This controller is responsible for handling
+    requests to the /chat/batch route.
+
+    :param body: BatchQuery object
+    :param admission: AdmissionController object, None when disabled
+    :param pipeline: Pipeline object built at application startup
+    :returns: NDJSONResponseOK object streaming one result per query
+    """
+    logger.debug("Entering route at /chat/batch...")
+    return NDJSONResponseOK(
+        _lines(service.chat_batch(body.queries, pipeline, admission), pipeline)
+    )
+
+
+async def source(id: str, if_none_match: Optional[str], pipeline: Pipeline) -> Response:
+    """
+    Source controller. This controller is responsible for handling requests
+    to the /sources/{id} route.
+
+    :param id: Document id
+    :param if_none_match: If-None-Match request header
+    :param pipeline: Pipeline object built at application startup
+    :returns: cacheable JSON response with the document
+    :raises NotFoundException: if the document does not exist
+    """
+    documents, _ = await service.sources([id], pipeline)
+    if not documents:
+        raise NotFoundException(id, "Source not found")
+    return cacheable_response(documents[0], if_none_match, pipeline.sources.max_age)
+
+
+async def sources(
+    ids: List[str], if_none_match: Optional[str], pipeline: Pipeline
+) -> Response:
+    """
+    Sources controller. This controller is responsible for handling requests
+    to the /sources route.
+
+    :param ids: Document ids
+    :param if_none_match: If-None-Match request header
+    :param pipeline: Pipeline object built at application startup
+    :returns: cacheable JSON response with the documents found and the
+        missing ids
+    """
+    documents, missing = await service.sources(ids, pipeline)
+    return cacheable_response(
+        SourceBatch(sources=documents, missing=missing),
+        if_none_match,
+        pipeline.sources.max_age,
+    )
+
+
+async def stats(pipeline: Pipeline) -> Response:
+    """
+    Statistics controller. This controller is responsible for handling
+    requests to the /stats route.
+
+    :param pipeline: Pipeline object built at application startup
+    :returns: JSONResponseOK object with the pipeline statistics
+    """
+    return JSONResponseOK(await service.stats(pipeline))
+
+
+def _present(response: ChatResponse, pipeline: Pipeline) -> ChatResponse:
+    """
+    :param response: ChatResponse object with full sources
+    :param pipeline: Pipeline object built at application startup
+    :returns: the response, with source references if configured
+    """
+    if pipeline.sources.references:
+        return service.references(response)
+    return response
+
+
+async def _events(
+    stream: AsyncIterator[Union[str, ChatResponse]], pipeline: Pipeline
+) -> AsyncIterator[str]:
+    """
+    Translate the service stream into Server-Sent Events. Headers are already
+    sent once streaming starts, so failures are reported as an error event
+    using the regular error format.
+
+    :param stream: Async iterator returned by service.chat_stream
+    :param pipeline: Pipeline object built at application startup
+    :returns: async iterator of formatted events
+    """
+    try:
+        async for item in stream:
+            if isinstance(item, ChatResponse):
+                yield format_event("sources", _present(item, pipeline))
+            else:
+                yield format_event("token", {"token": item})
+    except Exception as e:
+        logger.exception(e)
+        yield format_event("error", ServerException("Internal Server Error").detail)
+    finally:
+        await stream.aclose()
+
+
+async def _lines(
+    stream: AsyncIterator[Tuple[int, Union[ChatResponse, Exception]]],
+    pipeline: Pipeline,
+) -> AsyncIterator[bytes]:
+    """
+    Translate the service stream into NDJSON lines. A failed query is
+    reported on its own line using the regular error format, the others are
+    unaffected.
+
+    :param stream: Async iterator returned by service.chat_batch
+    :param pipeline: Pipeline object built at application startup
+    :returns: async iterator of encoded lines
+    """
+    try:
+        async for index, item in stream:
+            if isinstance(item, Rejected):
+                logger.warning(f"Batch query {index} not admitted: {item.reason}")
+                exception = ServiceUnavailableException(
+                    "Server is overloaded", item.retry_after
+                )
+                yield format_line(BatchResult(index=index, detail=exception.detail))
+            elif isinstance(item, Exception):
+                logger.opt(exception=item).error(f"Batch query {index} failed")
+                detail = ServerException("Internal Server Error").detail
+                yield format_line(BatchResult(index=index, detail=detail))
+            else:
+                response = _present(item, pipeline)
+                yield format_line(BatchResult(index=index, response=response))
+    finally:
+        await stream.aclose()
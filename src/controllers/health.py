@@ -0,0 +1,35 @@
+from fastapi import Response, status
+
+from ..common.responses import JSONResponse, JSONResponseOK
+from ..services import health as service
+from ..services.health import Startup
+
+
+async def healthz(startup: Startup) -> Response:
+    """
+    Liveness controller. This controller is responsible for handling requests
+    to the /healthz route. Answers as soon as the server accepts connections.
+
+    :param startup: Startup object created at application startup
+    :returns: JSONResponseOK object, or a 503 JSONResponse once the startup
+        failed
+    """
+    report = service.liveness(startup)
+    if not report["alive"]:
+        return JSONResponse(report, status.HTTP_503_SERVICE_UNAVAILABLE)
+    return JSONResponseOK(report)
+
+
+async def readyz(startup: Startup) -> Response:
+    """
+    Readiness controller. This controller is responsible for handling
+    requests to the /readyz route.
+
+    :param startup: Startup object created at application startup
+    :returns: JSONResponseOK object once ready, a 503 JSONResponse with the
+        same report until then
+    """
+    report = await service.readiness(startup)
+    if not report["ready"]:
+        return JSONResponse(report, status.HTTP_503_SERVICE_UNAVAILABLE)
+    return JSONResponseOK(report)
@@ -0,0 +1,19 @@
+from fastapi import Response
+
+from ..common.responses import PlainTextResponseOK
+from ..services import metrics as service
+from ..services.pipeline import Pipeline
+
+
+async def metrics(pipeline: Pipeline) -> Response:
+    """
+    Metrics controller. This controller is responsible for handling requests
+    to the /metrics route.
+
+    :param pipeline: Pipeline object built at application startup
+    :returns: PlainTextResponseOK object in the Prometheus text format
+    """
+    return PlainTextResponseOK(
+        await service.metrics(pipeline),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
@@ -4,10 +4,9 @@ from dotenv import load_dotenv, find_dotenv
 from loguru import logger
 import uvicorn
 
-from .app import app
 from .utils.config import Config
 from .utils.logging import construct_logger
-from .utils.sys import cleanup
+from .utils.sys import available_cpus, forward
 
 load_dotenv(find_dotenv())
 
@@ -18,11 +17,21 @@ if __name__ == "__main__":
     construct_logger(**logging_kwargs)
 
     logger.info("Configuration loaded successfully")
-    logger.info("Starting server...")
-
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, cleanup)
-    signal.signal(signal.SIGINT, cleanup)
 
     uvicorn_kwargs = config.uvicorn.to_dict()
-    uvicorn.run(app, **uvicorn_kwargs)
+    if uvicorn_kwargs["workers"] is None:
+        uvicorn_kwargs["workers"] = available_cpus()
+    # every process would load its own copy of the store's vector index
+    if config.chromadb.mode == "persistent" and uvicorn_kwargs["workers"] > 1:
+        logger.warning("A persistent Chroma store is served by a single worker")
+        uvicorn_kwargs["workers"] = 1
+    logger.info(f"Starting server with {uvicorn_kwargs['workers']} worker(s)...")
+
+    # SIGINT and SIGTERM are handled by uvicorn, which stops the workers
+    # first. The profiling signals are handled by the workers
+    if config.profiling.enabled and uvicorn_kwargs["workers"] > 1:
+        signal.signal(signal.SIGUSR1, forward)
+        signal.signal(signal.SIGUSR2, forward)
+
+    # passed by import string, so every worker process imports its own app
+    uvicorn.run("src.app:app", **uvicorn_kwargs)
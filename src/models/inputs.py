@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel, Field
 
 
@@ -15,3 +17,18 @@ class Query(BaseModel):
         description="Query to ask the agent",
         examples=[""],
     )
+
+
+class BatchQuery(BaseModel):
+    """
+    Model to describe the structure of the request body for the batch chat
+    route. Performs validation on the request body.
+    """
+
+    queries: List[Query] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        title="Queries",
+        description="Queries to ask the agent, answered concurrently",
+    )
@@ -1,6 +1,60 @@
+from typing import Optional, Union
+
 from pydantic import BaseModel, Field
 
 
+class Source(BaseModel):
+    page_content: str = Field(
+        ...,
+        title="Page Content",
+        description="The text of the retrieved document",
+        examples=["Hello World"],
+    )
+    metadata: dict = Field(
+        ...,
+        title="Metadata",
+        description="The metadata stored alongside the document",
+        examples=[{"title": "Hello World", "source": "https://example.com"}],
+    )
+
+
+class SourceReference(BaseModel):
+    id: str = Field(
+        ...,
+        title="Id",
+        description="Id of the document, fetch it from /api/sources/{id}",
+        examples=["5f1c0c8a..."],
+    )
+    title: Optional[str] = Field(
+        None,
+        title="Title",
+        description="Title of the document",
+        examples=["Hello World"],
+    )
+    link: Optional[str] = Field(
+        None,
+        title="Link",
+        description="Link to the original document",
+        examples=["https://example.com"],
+    )
+    score: Optional[float] = Field(
+        None,
+        title="Score",
+        description="Retrieval score of the document, on the scale of its scorer",
+        examples=[0.82],
+    )
+    scorer: Optional[str] = Field(
+        None,
+        title="Scorer",
+        description=(
+            "What the score is: `vector` cosine similarity, `hybrid` reciprocal "
+            "rank fusion score or `keywords` BM25 score. Scores are only "
+            "comparable between sources of the same scorer"
+        ),
+        examples=["vector"],
+    )
+
+
 class ChatResponse(BaseModel):
     answer: str = Field(
         ...,
@@ -8,9 +62,48 @@ class ChatResponse(BaseModel):
         description="The answer to the question",
         examples=["Hello World"],
     )
-    sources: list = Field(
+    sources: list[Union[Source, SourceReference]] = Field(
         ...,
         title="Sources",
-        description="The sources used to answer the question",
-        examples=["Hello World", "Hello World"],
+        description="The sources used to answer the question, in full or as "
+        "references depending on the `sources.references` setting",
+    )
+    cached: bool = Field(
+        False,
+        title="Cached",
+        description="Whether the answer was served from the answer cache",
+        examples=[False],
+    )
+
+
+class BatchResult(BaseModel):
+    index: int = Field(
+        ...,
+        title="Index",
+        description="Position of the query in the batch",
+        examples=[0],
+    )
+    response: Optional[ChatResponse] = Field(
+        None,
+        title="Response",
+        description="The answer, absent if the query failed",
+    )
+    detail: Optional[dict] = Field(
+        None,
+        title="Detail",
+        description="The error, in the usual error format, if the query failed",
+    )
+
+
+class SourceBatch(BaseModel):
+    sources: list[Source] = Field(
+        ...,
+        title="Sources",
+        description="The documents found, in the requested order",
+    )
+    missing: list[str] = Field(
+        ...,
+        title="Missing",
+        description="The requested ids that do not exist",
+        examples=[[]],
     )
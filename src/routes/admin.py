@@ -0,0 +1,23 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from ..common.dependencies import get_profiler
+from ..controllers import admin as controller
+from ..services.profiling import Profiler
+
+router = APIRouter()
+
+
+@router.post("/profile")
+async def start_profile(
+    requests: Optional[int] = Query(None, gt=0),
+    seconds: Optional[float] = Query(None, gt=0),
+    profiler: Profiler = Depends(get_profiler),
+):
+    return await controller.start_profile(requests, seconds, profiler)
+
+
+@router.delete("/profile")
+async def stop_profile(profiler: Profiler = Depends(get_profiler)):
+    return await controller.stop_profile(profiler)
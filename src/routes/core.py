@@ -1,11 +1,53 @@
-from fastapi import APIRouter
+from typing import List, Optional
 
+from fastapi import APIRouter, Depends, Header, Query as QueryParam
+
+from ..common.dependencies import admit, admit_batch, get_pipeline
 from ..controllers import core as controller
-from ..models.inputs import Query
+from ..models.inputs import BatchQuery, Query
+from ..services.admission import AdmissionController
+from ..services.pipeline import Pipeline
 
 router = APIRouter()
 
 
-@router.post("/chat")
-async def chat(body: Query):
-    return await controller.chat(body)
+@router.post("/chat", dependencies=[Depends(admit)])
+async def chat(body: Query, pipeline: Pipeline = Depends(get_pipeline)):
+    return await controller.chat(body, pipeline)
+
+
+@router.post("/chat/stream", dependencies=[Depends(admit)])
+async def chat_stream(body: Query, pipeline: Pipeline = Depends(get_pipeline)):
+    return await controller.chat_stream(body, pipeline)
+
+
+@router.post("/chat/batch")
+async def chat_batch(
+    body: BatchQuery,
+    admission: Optional[AdmissionController] = Depends(admit_batch),
+    pipeline: Pipeline = Depends(get_pipeline),
+):
+    return await controller.chat_batch(body, admission, pipeline)
+
+
+@router.get("/sources")
+async def sources(
+    id: List[str] = QueryParam(..., min_length=1, max_length=100),
+    if_none_match: Optional[str] = Header(None),
+    pipeline: Pipeline = Depends(get_pipeline),
+):
+    return await controller.sources(id, if_none_match, pipeline)
+
+
+@router.get("/sources/{id}")
+async def source(
+    id: str,
+    if_none_match: Optional[str] = Header(None),
+    pipeline: Pipeline = Depends(get_pipeline),
+):
+    return await controller.source(id, if_none_match, pipeline)
+
+
+@router.get("/stats")
+async def stats(pipeline: Pipeline = Depends(get_pipeline)):
+    return await controller.stats(pipeline)
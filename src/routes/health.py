@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+
+from ..common.dependencies import get_startup
+from ..controllers import health as controller
+from ..services.health import Startup
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz(startup: Startup = Depends(get_startup)):
+    return await controller.healthz(startup)
+
+
+@router.get("/readyz")
+async def readyz(startup: Startup = Depends(get_startup)):
+    return await controller.readyz(startup)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+
+from ..common.dependencies import get_pipeline
+from ..controllers import metrics as controller
+from ..services.pipeline import Pipeline
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(pipeline: Pipeline = Depends(get_pipeline)):
+    return await controller.metrics(pipeline)
@@ -0,0 +1,171 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import math
+import time
+from typing import AsyncIterator, Deque, Optional
+
+from cachetools import LRUCache
+
+from ..utils.metrics import timed
+from .metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    STAGE_SECONDS,
+)
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted.
+    """
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        """
+        :param reason: `queue_full`, `queue_timeout` or `rate_limited`
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        ADMISSION_REJECTED.inc(reason=reason)
+
+
+class AdmissionController:
+    """
+    Caps the number of requests handled at once. Requests beyond `max_active`
+    wait in a FIFO queue of at most `max_queue` entries for at most
+    `max_wait` seconds, the others are rejected right away. When the LLM
+    upstream slows down, excess load is shed early instead of piling up in
+    memory and slowing every request down.
+
+    A finishing request hands its slot straight to the oldest waiter, so
+    newcomers cannot overtake the queue.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, max_wait: float) -> None:
+        """
+        :param max_active: Requests handled at once
+        :param max_queue: Requests waiting for a slot at most
+        :param max_wait: Seconds a request waits for a slot at most
+        """
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def _acquire(self) -> None:
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected("queue_full", self.max_wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.inc()
+        try:
+            with timed(STAGE_SECONDS, "admission"):
+                await asyncio.wait_for(waiter, self.max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over as the wait ended, pass it on
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("queue_timeout", self.max_wait) from None
+            raise
+        finally:
+            ADMISSION_QUEUED.dec()
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block.
+
+        :raises Rejected: if the queue is full or the wait timed out
+        """
+        await self._acquire()
+        ADMISSION_ACTIVE.inc()
+        try:
+            yield
+        finally:
+            ADMISSION_ACTIVE.dec()
+            self._release()
+
+
+class RateLimiter:
+    """
+    Token bucket per client. Every client may send `burst` requests at once
+    and `rate` requests per second on average. Buckets of the least recently
+    seen clients are forgotten beyond `max_clients`, those start full again.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_clients: int,
+        client_header: Optional[str] = None,
+        trusted_hops: int = 1,
+    ) -> None:
+        """
+        :param rate: Tokens added per second
+        :param burst: Bucket capacity
+        :param max_clients: Number of buckets kept
+        :param client_header: Request header listing the client addresses,
+            the peer address is used when unset or missing
+        :param trusted_hops: Number of proxies in front of the service that
+            append to the header
+        """
+        self.rate = rate
+        self.burst = burst
+        self.client_header = client_header
+        self.trusted_hops = trusted_hops
+        self._buckets: LRUCache = LRUCache(maxsize=max_clients)
+
+    def identify(self, forwarded: Optional[str], peer: Optional[str]) -> str:
+        """
+        Client identity of a request. Every proxy appends the address it
+        received the request from, and the client may send any entries it
+        likes in front of them. Only the entries appended by the trusted
+        proxies, counted from the right, can be relied on.
+
+        :param forwarded: Value of the client header, if any
+        :param peer: Address of the connected peer, if any
+        :returns: Client identity
+        """
+        entries = [entry.strip() for entry in (forwarded or "").split(",")]
+        if self.client_header is not None and len(entries) >= self.trusted_hops:
+            if client := entries[-self.trusted_hops]:
+                return client
+        return peer or "unknown"
+
+    def acquire(self, client: str, cost: int = 1) -> None:
+        """
+        Take tokens from the client's bucket. A request costing more than the
+        bucket holds is admitted while a token is left, and leaves the bucket
+        in debt until the client's rate pays it back.
+
+        :param client: Client identity
+        :param cost: Number of tokens the request costs
+        :raises Rejected: if the bucket is empty
+        """
+        now = time.monotonic()
+        tokens, stamp = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            raise Rejected("rate_limited", (1 - tokens) / self.rate)
+        self._buckets[client] = (tokens - cost, now)
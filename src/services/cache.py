@@ -0,0 +1,288 @@
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cachetools import LRUCache
+from langchain.schema import Document
+import numpy as np
+
+from ..models.outputs import ChatResponse
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings. A cached ChatResponse is served
+    when a new query vector lies within `threshold` cosine similarity of a
+    cached one and the retrieved source ids are the same, so paraphrases of a
+    question skip the LLM call.
+
+    Vectors live in a preallocated matrix and lookups are a single
+    matrix-vector product. Once `maxsize` entries are stored the oldest one is
+    overwritten. All entries are dropped when the collection version changes.
+    """
+
+    def __init__(self, threshold: float, maxsize: int) -> None:
+        """
+        :param threshold: Minimum cosine similarity for a cache hit
+        :param maxsize: Maximum number of cached answers
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[tuple]] = [None] * maxsize
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self) -> None:
+        """
+        Drop all cached answers.
+        """
+        self._entries = [None] * self.maxsize
+        self._size = 0
+        self._next = 0
+
+    def lookup(
+        self, vector: Sequence[float], source_ids: Sequence[str], version: str
+    ) -> Optional[ChatResponse]:
+        """
+        :param vector: Query embedding
+        :param source_ids: Ids of the documents retrieved for the query
+        :param version: Current collection version
+        :returns: Cached ChatResponse or None on a miss
+        """
+        self._check_version(version)
+
+        if self._size:
+            query = self._normalize(vector)
+            similarities = self._vectors[: self._size] @ query
+            candidates = np.flatnonzero(similarities >= self.threshold)
+
+            key = frozenset(source_ids)
+            for i in candidates[np.argsort(-similarities[candidates])]:
+                ids, response = self._entries[i]
+                if ids == key:
+                    self.hits += 1
+                    return response
+
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        vector: Sequence[float],
+        source_ids: Sequence[str],
+        version: str,
+        response: ChatResponse,
+    ) -> None:
+        """
+        :param vector: Query embedding
+        :param source_ids: Ids of the documents the answer was generated from
+        :param version: Collection version the documents were retrieved at
+        :param response: ChatResponse to cache
+        """
+        self._check_version(version)
+
+        query = self._normalize(vector)
+        if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+            self._vectors = np.zeros((self.maxsize, query.shape[0]), dtype=np.float32)
+            self.clear()
+
+        self._vectors[self._next] = query
+        self._entries[self._next] = (frozenset(source_ids), response)
+        self._next = (self._next + 1) % self.maxsize
+        self._size = min(self._size + 1, self.maxsize)
+
+    def stats(self) -> dict:
+        """
+        :returns: Hit and miss counts, hit ratio and number of cached answers
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": self._size,
+        }
+
+
+class DocumentStore:
+    """
+    Document bodies shared by the entries of the retrieval cache. Every
+    document is stored once however many cached results include it, and is
+    dropped once no entry refers to it anymore.
+    """
+
+    def __init__(self) -> None:
+        # id -> [page content, metadata without score, number of references]
+        self._documents: Dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, documents: Sequence[Document]) -> None:
+        """
+        Take a reference to every document, storing the ones not known yet.
+
+        :param documents: Documents with `id` and `score` metadata
+        """
+        for doc in documents:
+            entry = self._documents.get(doc.metadata["id"])
+            if entry is None:
+                metadata = {k: v for k, v in doc.metadata.items() if k != "score"}
+                entry = self._documents[doc.metadata["id"]] = [
+                    doc.page_content,
+                    metadata,
+                    0,
+                ]
+            entry[2] += 1
+
+    def release(self, ids: Sequence[str]) -> None:
+        """
+        Drop a reference to every document, forgetting unreferenced ones.
+
+        :param ids: Ids of the documents
+        """
+        for id in ids:
+            entry = self._documents[id]
+            entry[2] -= 1
+            if not entry[2]:
+                del self._documents[id]
+
+    def get(self, id: str, score: float) -> Document:
+        """
+        :param id: Id of a stored document
+        :param score: Similarity score to report in the metadata
+        :returns: Document object with `id` and `score` metadata
+        """
+        page_content, metadata, _ = self._documents[id]
+        return Document(
+            page_content=page_content, metadata={**metadata, "score": score}
+        )
+
+    def clear(self) -> None:
+        """
+        Drop all documents.
+        """
+        self._documents.clear()
+
+
+class _Results(LRUCache):
+    """
+    LRUCache of (id, score) tuples releasing the documents of evicted
+    entries from the store.
+    """
+
+    def __init__(self, maxsize: int, documents: DocumentStore) -> None:
+        super().__init__(maxsize=maxsize)
+        self.documents = documents
+
+    def popitem(self):
+        key, results = super().popitem()
+        self.documents.release([id for id, _ in results])
+        return key, results
+
+
+class RetrievalCache:
+    """
+    Cache of similarity search results, for queries whose answer cannot be
+    reused but whose Chroma query is repeated verbatim. Entries are keyed on
+    the collection, the query vector and the retrieval parameters and only
+    hold document ids and scores, the bodies live once in a DocumentStore.
+    Least recently used entries are evicted beyond `maxsize`, and all are
+    dropped when the collection version changes, which the ingestion script
+    bumps whenever it writes.
+    """
+
+    def __init__(self, maxsize: int, collection: str, params: dict) -> None:
+        """
+        :param maxsize: Maximum number of cached results
+        :param collection: Name of the queried collection
+        :param params: Retrieval parameters, part of the key
+        """
+        self.version: Optional[str] = None
+        self.documents = DocumentStore()
+        self.hits = 0
+        self.misses = 0
+        self._results = _Results(maxsize, self.documents)
+        self._prefix = f"{collection}\0{json.dumps(params, sort_keys=True)}\0"
+
+    def _key(self, vector: Sequence[float]) -> str:
+        digest = hashlib.sha256(self._prefix.encode())
+        digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+        return digest.hexdigest()
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self) -> None:
+        """
+        Drop all cached results and documents.
+        """
+        self._results.clear()
+        self.documents.clear()
+
+    def lookup(self, vector: Sequence[float], version: str) -> Optional[List[Document]]:
+        """
+        :param vector: Query embedding
+        :param version: Current collection version
+        :returns: Cached documents or None on a miss
+        """
+        self._check_version(version)
+
+        results: Optional[Tuple[Tuple[str, float], ...]] = self._results.get(
+            self._key(vector)
+        )
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self.documents.get(id, score) for id, score in results]
+
+    def store(
+        self, vector: Sequence[float], version: str, documents: List[Document]
+    ) -> None:
+        """
+        :param vector: Query embedding
+        :param version: Collection version the documents were retrieved at
+        :param documents: Retrieved documents with `id` and `score` metadata
+        """
+        self._check_version(version)
+
+        key = self._key(vector)
+        if key in self._results:
+            return
+        self.documents.add(documents)
+        self._results[key] = tuple(
+            (doc.metadata["id"], doc.metadata["score"]) for doc in documents
+        )
+
+    def stats(self) -> dict:
+        """
+        :returns: Hit and miss counts, hit ratio, number of cached results
+            and of stored documents
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._results),
+            "documents": len(self.documents),
+        }
@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from loguru import logger
+
+from ..utils.logging import request_id
+from ..utils.metrics import Timings, current_timings
+
+T = TypeVar("T")
+
+
+class _Call:
+    """
+    A shared in-flight call, the stages it ran, the request that started it
+    and the number of callers waiting on it.
+    """
+
+    def __init__(
+        self, task: asyncio.Task, timings: Timings, owner: Optional[str]
+    ) -> None:
+        self.task = task
+        self.timings = timings
+        self.owner = owner
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls sharing a key. The first caller starts the
+    call in its own task and later callers with the same key wait on that
+    task instead of starting another. Results and exceptions are delivered to
+    every waiter.
+
+    The call records its Server-Timing stages apart from any request, and
+    they are copied into the timings of every waiter once it completes.
+    Its log lines carry the id of the request that started it, and callers
+    joining it log that id under their own.
+
+    A waiter being cancelled (e.g. its client disconnected) does not cancel
+    the shared call while other waiters remain. Once the last waiter is gone
+    the call is cancelled and forgotten, so a later caller starts afresh.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        :param key: Key identifying identical calls
+        :param func: Zero-argument coroutine function performing the call
+        :returns: The result of the (possibly shared) call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            timings = Timings()
+            task = asyncio.create_task(self._run(func, timings))
+            call = self._calls[key] = _Call(task, timings, request_id.get())
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.shared += 1
+            logger.info(f"Sharing the in-flight call of request {call.owner}")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.task.done():
+                if (timings := current_timings.get()) is not None:
+                    timings.merge(call.timings)
+            elif call.waiters == 0:
+                self._forget(key, call)
+                call.task.cancel()
+
+    @staticmethod
+    async def _run(func: Callable[[], Awaitable[T]], timings: Timings) -> T:
+        # the task runs in a copy of the first caller's context
+        current_timings.set(timings)
+        return await func()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        """
+        :returns: Number of calls started, callers that joined an in-flight
+            call and calls currently in flight
+        """
+        return {
+            "started": self.started,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,102 @@
+import hashlib
+from typing import List, Tuple
+
+from cachetools import LRUCache
+from langchain.schema import Document
+import tiktoken
+
+
+def encoding_for(model: str) -> tiktoken.Encoding:
+    """
+    :param model: Name of the LLM
+    :returns: the model's tokenizer, cl100k_base for unknown models
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def encode(encoding: tiktoken.Encoding, text: str) -> List[int]:
+    """
+    Tokenize untrusted text. Special tokens such as `<|endoftext|>` are
+    encoded as plain text instead of raising ValueError.
+
+    :param encoding: Tokenizer of the model
+    :param text: Text from users or documents
+    :returns: list of tokens
+    """
+    return encoding.encode(text, disallowed_special=())
+
+
+class ContextPacker:
+    """
+    Fits retrieved documents into a token budget before they are stuffed into
+    the prompt. Documents are taken highest score first, exact duplicates are
+    dropped and the last document that does not fit whole is trimmed to the
+    remaining budget, so prompt size no longer grows with document length.
+    """
+
+    def __init__(
+        self, encoding: tiktoken.Encoding, budget: int, min_tokens: int = 32
+    ) -> None:
+        """
+        :param encoding: Tokenizer of the LLM
+        :param budget: Maximum number of context tokens
+        :param min_tokens: Smallest trimmed document worth keeping
+        """
+        self.encoding = encoding
+        self.budget = budget
+        self.min_tokens = min_tokens
+        # the same documents are retrieved over and over, count them once
+        self._counts = LRUCache(maxsize=4096)
+
+    def count(self, document: Document) -> int:
+        """
+        :param document: Document to measure
+        :returns: Number of tokens in the document's content
+        """
+        key = document.metadata.get("id") or document.page_content
+        if (tokens := self._counts.get(key)) is None:
+            tokens = self._counts[key] = len(
+                encode(self.encoding, document.page_content)
+            )
+        return tokens
+
+    def pack(self, documents: List[Document]) -> Tuple[List[Document], int]:
+        """
+        :param documents: Retrieved documents, optionally with a `score`
+        :returns: tuple of the packed documents and their token count
+        """
+        ranked = sorted(
+            documents, key=lambda doc: doc.metadata.get("score", 0.0), reverse=True
+        )
+
+        packed: List[Document] = []
+        seen = set()
+        used = 0
+        for document in ranked:
+            normalized = " ".join(document.page_content.split())
+            digest = hashlib.sha1(normalized.encode()).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+
+            tokens = self.count(document)
+            remaining = self.budget - used
+            if tokens <= remaining:
+                packed.append(document)
+                used += tokens
+                continue
+
+            if remaining >= self.min_tokens:
+                content = self.encoding.decode(
+                    encode(self.encoding, document.page_content)[:remaining]
+                )
+                packed.append(
+                    Document(page_content=content, metadata=document.metadata)
+                )
+                used += remaining
+            break
+
+        return packed, used
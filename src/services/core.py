@@ -1,56 +1,605 @@
-import chromadb
-from chromadb.config import Settings
-from langchain.chat_models import ChatOpenAI
-from langchain.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from langchain.schema import Document
+from loguru import logger
 
 from ..models.inputs import Query
-from ..models.outputs import ChatResponse
-from ..utils.config import Config
+from ..models.outputs import ChatResponse, Source, SourceReference
+from ..utils.metrics import timed
+from .admission import AdmissionController
+from .context import encode
+from .embeddings import BatchedEmbeddings, normalize_query
+from .keywords import KeywordIndex, fuse, tokenize
+from .metrics import LLM_IN_FLIGHT, LLM_TOKENS, STAGE_SECONDS
+from .pipeline import Pipeline
+from .retrieval import ShardedRetriever
+from .streaming import TokenStreamHandler
 
 """
 Public Services
 """
 
-config = Config.get()
-chroma_kwargs = config.chromadb.to_dict()
-chroma = chromadb.HttpClient(
-    **chroma_kwargs, settings=Settings(chroma_api_impl="chromadb.api.fastapi.FastAPI")
-)
-
 
-async def chat(body: Query) -> ChatResponse:
+async def chat(body: Query, pipeline: Pipeline) -> ChatResponse:
     """
     Text report agent controller. This controller is responsible for handling
     requests to the /agents/text route.
 
     :param body: Query object
+    :param pipeline: Pipeline object built at application startup
     :returns: string answer for successful requests
     """
-    embeddings = OpenAIEmbeddings()
-    vector_db = Chroma(client=chroma, embedding_function=embeddings)
-    retriever = vector_db.as_retriever()
+    # identical concurrent queries share a single pipeline run
+    return await pipeline.singleflight.do(
+        normalize_query(body.query), lambda: _chat(body, pipeline)
+    )
+
+
+async def chat_stream(
+    body: Query, pipeline: Pipeline
+) -> AsyncIterator[Union[str, ChatResponse]]:
+    """
+    Streaming variant of chat. Yields the answer token by token as the LLM
+    produces it, followed by the complete ChatResponse once generation has
+    finished. Closing the iterator cancels the upstream LLM call.
+
+    :param body: Query object
+    :param pipeline: Pipeline object built at application startup
+    :returns: async iterator of string tokens and a final ChatResponse
+    """
+    vector, documents, prompt_tokens = await _retrieve(body, pipeline)
+
+    if (cached := await _lookup(vector, documents, pipeline)) is not None:
+        yield cached.answer
+        yield cached
+        return
+
+    handler = TokenStreamHandler(pipeline.stream_buffer)
+
+    async def generate() -> str:
+        async with _llm_slot(pipeline):
+            return await pipeline.stream_chain.arun(
+                input_documents=documents, question=body.query, callbacks=[handler]
+            )
+
+    task = asyncio.create_task(generate())
+    embedding = _embed_for_cache(body, vector, pipeline)
+    try:
+        async for token in handler.aiter(task):
+            yield token
+
+        answer = await task
+        _count_tokens(prompt_tokens, answer, pipeline)
+        llm_response = _response(answer, documents)
+        if embedding is not None:
+            vector = await embedding
+        await _store(vector, documents, llm_response, pipeline)
+        yield llm_response
+    finally:
+        task.cancel()
+        if embedding is not None:
+            embedding.cancel()
+
+
+async def chat_batch(
+    queries: List[Query],
+    pipeline: Pipeline,
+    admission: Optional[AdmissionController] = None,
+) -> AsyncIterator[Tuple[int, Union[ChatResponse, Exception]]]:
+    """
+    Batch variant of chat. Queries are embedded and retrieved in bulk, a
+    chunk of `batch.chunk_size` at a time, and at most `batch.parallelism`
+    answers are generated at once. Results are yielded in completion order
+    with the index of their query, a failed query yields its exception.
+    Retrieval of the next chunk waits until results are consumed, so a slow
+    consumer holds back the batch instead of results piling up in memory.
+    Closing the iterator cancels the pending queries. Every generation holds
+    an admission slot, like a chat request, and a query that is not
+    admitted yields Rejected.
 
-    llm_open = ChatOpenAI(
-        model=config.langchain.model,
-        callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
+    :param queries: Query objects
+    :param pipeline: Pipeline object built at application startup
+    :param admission: AdmissionController object generations are admitted by
+    :returns: async iterator of (index, ChatResponse or exception) tuples
+    """
+    parallelism = pipeline.batch.parallelism
+    chunk_size = pipeline.batch.chunk_size
+    slots = asyncio.Semaphore(parallelism)
+    results: asyncio.Queue = asyncio.Queue(maxsize=parallelism)
+    tasks = set()
+
+    async def answer(
+        index: int,
+        body: Query,
+        vector: Optional[List[float]],
+        documents: List[Document],
+        prompt_tokens: int,
+    ) -> None:
+        try:
+            try:
+                slot = admission.admit() if admission is not None else nullcontext()
+                async with slot:
+                    # identical queries share a run, across batches and /chat
+                    result = await pipeline.singleflight.do(
+                        normalize_query(body.query),
+                        lambda: _generate(
+                            body, vector, documents, prompt_tokens, pipeline
+                        ),
+                    )
+            except Exception as e:
+                result = e
+            await results.put((index, result))
+        finally:
+            slots.release()
+
+    async def produce() -> None:
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start : start + chunk_size]
+            try:
+                retrieved = await _retrieve_many(chunk, pipeline)
+            except Exception as e:
+                for index in range(start, start + len(chunk)):
+                    await results.put((index, e))
+                continue
+
+            for index, (body, item) in enumerate(zip(chunk, retrieved), start):
+                await slots.acquire()
+                task = asyncio.create_task(answer(index, body, *item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    producer = asyncio.create_task(produce())
+    try:
+        for _ in queries:
+            yield await results.get()
+    finally:
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+async def sources(ids: List[str], pipeline: Pipeline) -> Tuple[List[Source], List[str]]:
+    """
+    Fetch source documents by id.
+
+    :param ids: Document ids
+    :param pipeline: Pipeline object built at application startup
+    :returns: tuple of the documents found, in the requested order, and the
+        ids that do not exist
+    """
+    ids = list(dict.fromkeys(ids))
+    found = await pipeline.run_blocking(pipeline.retriever.get, ids)
+    documents = [
+        Source(page_content=found[id].page_content, metadata=found[id].metadata)
+        for id in ids
+        if id in found
+    ]
+    return documents, [id for id in ids if id not in found]
+
+
+def references(response: ChatResponse) -> ChatResponse:
+    """
+    Replace the sources of a response by compact references, which clients
+    resolve through /api/sources.
+
+    :param response: ChatResponse object with full sources
+    :returns: ChatResponse object with SourceReference sources
+    """
+    return response.model_copy(
+        update={
+            "sources": [
+                SourceReference(
+                    id=source.metadata["id"],
+                    title=source.metadata.get("title"),
+                    link=source.metadata.get("source"),
+                    score=source.metadata.get("score"),
+                    scorer=source.metadata.get("scorer"),
+                )
+                for source in response.sources
+            ]
+        }
     )
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm_open,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True,
-        verbose=True,
+
+async def stats(pipeline: Pipeline) -> dict:
+    """
+    Runtime statistics of the pipeline, such as cache hit and miss counters.
+
+    :param pipeline: Pipeline object built at application startup
+    :returns: dictionary of statistics grouped by component
+    """
+    stats = {
+        "embedding_cache": pipeline.embeddings.stats(),
+        "singleflight": pipeline.singleflight.stats(),
+    }
+    if isinstance(pipeline.embeddings.embeddings, BatchedEmbeddings):
+        stats["embedding_batches"] = pipeline.embeddings.embeddings.stats()
+    if pipeline.answer_cache is not None:
+        stats["answer_cache"] = pipeline.answer_cache.stats()
+    if pipeline.retrieval_cache is not None:
+        stats["retrieval_cache"] = pipeline.retrieval_cache.stats()
+    if isinstance(pipeline.retriever, ShardedRetriever):
+        stats["shards"] = pipeline.retriever.stats()
+    return stats
+
+
+"""
+Private Services
+"""
+
+
+async def _chat(body: Query, pipeline: Pipeline) -> ChatResponse:
+    """
+    Run the full pipeline for a query: retrieval, answer cache, generation.
+
+    :param body: Query object
+    :param pipeline: Pipeline object built at application startup
+    :returns: ChatResponse object
+    """
+    vector, documents, prompt_tokens = await _retrieve(body, pipeline)
+    return await _generate(body, vector, documents, prompt_tokens, pipeline)
+
+
+async def _generate(
+    body: Query,
+    vector: Optional[List[float]],
+    documents: List[Document],
+    prompt_tokens: int,
+    pipeline: Pipeline,
+) -> ChatResponse:
+    """
+    Answer a query from its retrieved documents, through the answer cache.
+
+    :param body: Query object
+    :param vector: Query vector, None on the keyword fast path
+        unless cached
+    :param documents: Packed documents
+    :param prompt_tokens: Number of prompt tokens
+    :param pipeline: Pipeline object built at application startup
+    :returns: ChatResponse object
+    """
+    if (cached := await _lookup(vector, documents, pipeline)) is not None:
+        return cached
+
+    embedding = _embed_for_cache(body, vector, pipeline)
+    try:
+        async with _llm_slot(pipeline):
+            answer = await pipeline.qa_chain.arun(
+                input_documents=documents, question=body.query
+            )
+        _count_tokens(prompt_tokens, answer, pipeline)
+
+        llm_response = _response(answer, documents)
+        if embedding is not None:
+            vector = await embedding
+        await _store(vector, documents, llm_response, pipeline)
+    finally:
+        if embedding is not None:
+            embedding.cancel()
+
+    return llm_response
+
+
+async def _retrieve(
+    body: Query, pipeline: Pipeline
+) -> Tuple[Optional[List[float]], List[Document], int]:
+    """
+    Embed the query, fetch the nearest documents, fuse them with the keyword
+    hits and pack them into the context token budget. A short query matching
+    the keyword index confidently is answered from it alone, without
+    embedding it.
+
+    :param body: Query object
+    :param pipeline: Pipeline object built at application startup
+    :returns: tuple of the query vector (on the keyword fast path only when
+        already cached, else None), the packed documents and the number of
+        prompt tokens
+    """
+    hits, fast = _keyword_search(body, await pipeline.keyword_index(), pipeline)
+
+    vector = await pipeline.embeddings.peek(body.query) if fast else None
+    documents = None
+    if not fast:
+        with timed(STAGE_SECONDS, "embed"):
+            vector = await pipeline.embeddings.aembed_query(body.query)
+
+    with timed(STAGE_SECONDS, "retrieve"):
+        if not fast:
+            [documents] = await _search([vector], pipeline)
+        [documents] = await _merge([documents], [hits], pipeline)
+
+    return (vector, *_pack(body, documents, pipeline))
+
+
+async def _retrieve_many(
+    bodies: List[Query], pipeline: Pipeline
+) -> List[Tuple[Optional[List[float]], List[Document], int]]:
+    """
+    Bulk variant of _retrieve: one embedding call for the uncached queries,
+    one Chroma query for all of them and one for the documents only found
+    by keywords.
+
+    :param bodies: Query objects
+    :param pipeline: Pipeline object built at application startup
+    :returns: list of _retrieve tuples, in order
+    """
+    keywords = await pipeline.keyword_index()
+    hits, fast = zip(*(_keyword_search(body, keywords, pipeline) for body in bodies))
+    slow = [i for i, skip in enumerate(fast) if not skip]
+
+    vectors = [
+        await pipeline.embeddings.peek(body.query) if skip else None
+        for body, skip in zip(bodies, fast)
+    ]
+    batches: List[Optional[List[Document]]] = [None] * len(bodies)
+    with timed(STAGE_SECONDS, "embed"):
+        if slow:
+            embedded = await pipeline.embeddings.aembed_queries(
+                [bodies[i].query for i in slow]
+            )
+            for i, vector in zip(slow, embedded):
+                vectors[i] = vector
+
+    with timed(STAGE_SECONDS, "retrieve"):
+        if slow:
+            found = await _search([vectors[i] for i in slow], pipeline)
+            for i, documents in zip(slow, found):
+                batches[i] = documents
+        batches = await _merge(batches, list(hits), pipeline)
+
+    return [
+        (vector, *_pack(body, documents, pipeline))
+        for body, vector, documents in zip(bodies, vectors, batches)
+    ]
+
+
+def _keyword_search(
+    body: Query, keywords: Optional[KeywordIndex], pipeline: Pipeline
+) -> Tuple[List[Tuple[str, float]], bool]:
+    """
+    Look the query up in the keyword index.
+
+    :param body: Query object
+    :param keywords: KeywordIndex object, None when unavailable
+    :param pipeline: Pipeline object built at application startup
+    :returns: tuple of the (id, score) hits, best first, and whether they
+        are confident enough to skip the vector search
+    """
+    if keywords is None:
+        return [], False
+
+    config = pipeline.keyword_config
+    with timed(STAGE_SECONDS, "keywords"):
+        hits, confidence = keywords.search(
+            body.query, pipeline.retriever.config.k, config.k1, config.b
+        )
+    fast = (
+        config.fast_path.enabled
+        and bool(hits)
+        and len(tokenize(body.query)) <= config.fast_path.max_terms
+        and confidence >= config.fast_path.min_confidence
     )
+    return hits, fast
+
 
-    chain_output = qa_chain(body.query)
-    llm_response = ChatResponse(
-        answer=chain_output["result"],
-        sources=chain_output["source_documents"],
+async def _merge(
+    batches: List[Optional[List[Document]]],
+    hits: List[List[Tuple[str, float]]],
+    pipeline: Pipeline,
+) -> List[List[Document]]:
+    """
+    Combine the vector search results of every query with its keyword hits.
+    Documents only found by keywords are fetched from Chroma in one call.
+
+    :param batches: Vector search results per query, None on the fast path
+    :param hits: Keyword hits per query, empty without a keyword index
+    :param pipeline: Pipeline object built at application startup
+    :returns: one list of Document objects per query, in order
+    """
+    known = {doc.metadata["id"]: doc for docs in batches if docs for doc in docs}
+    missing = list(
+        dict.fromkeys(id for item in hits for id, _ in item if id not in known)
     )
+    if missing:
+        known.update(await pipeline.run_blocking(pipeline.retriever.get, missing))
 
-    return llm_response
+    config = pipeline.keyword_config
+    merged = []
+    for documents, item in zip(batches, hits):
+        if documents is None:
+            # fast path, ranked by keyword score alone
+            documents = [
+                Document(
+                    page_content=known[id].page_content,
+                    metadata={
+                        **known[id].metadata,
+                        "score": score,
+                        "scorer": "keywords",
+                    },
+                )
+                for id, score in item
+                if id in known
+            ]
+        elif item:
+            documents = fuse(
+                documents, item, pipeline.retriever.config.k, config.rrf_k, known
+            )
+        merged.append(documents)
+    return merged
+
+
+async def _search(
+    vectors: List[List[float]], pipeline: Pipeline
+) -> List[List[Document]]:
+    """
+    Fetch the nearest documents of every query vector, from the retrieval
+    cache when possible and with one Chroma query for the others.
+
+    :param vectors: Query vectors
+    :param pipeline: Pipeline object built at application startup
+    :returns: one list of Document objects per query vector, in order
+    """
+    cache = pipeline.retrieval_cache
+    if cache is None:
+        # chroma's client is synchronous, keep it off the event loop
+        return await pipeline.run_blocking(pipeline.retriever.search_many, vectors)
+
+    version = await pipeline.collection_version()
+    batches = [cache.lookup(vector, version) for vector in vectors]
+    missing = [i for i, documents in enumerate(batches) if documents is None]
+    if missing:
+        found = await pipeline.run_blocking(
+            pipeline.retriever.search_many, [vectors[i] for i in missing]
+        )
+        for i, documents in zip(missing, found):
+            batches[i] = documents
+            cache.store(vectors[i], version, documents)
+    return batches
+
+
+def _pack(
+    body: Query, documents: List[Document], pipeline: Pipeline
+) -> Tuple[List[Document], int]:
+    """
+    Pack retrieved documents into the context token budget.
+
+    :param body: Query object
+    :param documents: Retrieved documents
+    :param pipeline: Pipeline object built at application startup
+    :returns: tuple of the packed documents and the number of prompt tokens
+    """
+    with timed(STAGE_SECONDS, "pack"):
+        packed, context_tokens = pipeline.packer.pack(documents)
+        retrieved_tokens = sum(pipeline.packer.count(doc) for doc in documents)
+        question_tokens = len(encode(pipeline.packer.encoding, body.query))
+
+    prompt_tokens = pipeline.prompt_overhead + question_tokens + context_tokens
+    logger.info(
+        f"Prompt tokens: {prompt_tokens} "
+        f"(context {context_tokens} of {retrieved_tokens} retrieved, "
+        f"{len(packed)}/{len(documents)} documents)"
+    )
+
+    return packed, prompt_tokens
+
+
+@asynccontextmanager
+async def _llm_slot(pipeline: Pipeline) -> AsyncIterator[None]:
+    """
+    Hold one of the pipeline's LLM concurrency slots. Time spent waiting for
+    a slot and time spent generating are recorded as separate stages.
+
+    :param pipeline: Pipeline object built at application startup
+    """
+    with timed(STAGE_SECONDS, "llm_queue"):
+        await pipeline.llm_semaphore.acquire()
+
+    LLM_IN_FLIGHT.inc()
+    try:
+        with timed(STAGE_SECONDS, "llm"):
+            yield
+    finally:
+        LLM_IN_FLIGHT.dec()
+        pipeline.llm_semaphore.release()
+
+
+def _embed_for_cache(
+    body: Query, vector: Optional[List[float]], pipeline: Pipeline
+) -> Optional[asyncio.Task]:
+    """
+    Queries on the keyword fast path are not embedded before retrieval. With
+    the answer cache enabled, embed them while the answer is generated, so
+    the answer can still be cached.
+
+    :param body: Query object
+    :param vector: Query vector, if known
+    :param pipeline: Pipeline object built at application startup
+    :returns: task resolving to the query vector, or to None if embedding
+        failed, or None when there is nothing to embed
+    """
+    if vector is not None or pipeline.answer_cache is None:
+        return None
+
+    async def embed() -> Optional[List[float]]:
+        try:
+            return await pipeline.embeddings.aembed_query(body.query)
+        except Exception as e:
+            logger.warning(f"Embedding for the answer cache failed: {e!r}")
+            return None
+
+    return asyncio.create_task(embed())
+
+
+def _count_tokens(prompt_tokens: int, answer: str, pipeline: Pipeline) -> None:
+    """
+    :param prompt_tokens: Number of tokens sent to the LLM
+    :param answer: Generated answer
+    :param pipeline: Pipeline object built at application startup
+    """
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(len(encode(pipeline.packer.encoding, answer)), kind="completion")
+
+
+async def _lookup(
+    vector: Optional[List[float]], documents: List[Document], pipeline: Pipeline
+) -> Optional[ChatResponse]:
+    """
+    Look up a previous answer to a near-identical query over the same sources.
+
+    :param vector: Query vector, None on the keyword fast path
+        unless cached
+    :param documents: Retrieved documents
+    :param pipeline: Pipeline object built at application startup
+    :returns: cached ChatResponse flagged as cached, or None
+    """
+    # the cache is keyed on vectors, unknown on the keyword fast path
+    if pipeline.answer_cache is None or vector is None:
+        return None
+
+    with timed(STAGE_SECONDS, "cache"):
+        version = await pipeline.collection_version()
+        source_ids = [doc.metadata["id"] for doc in documents]
+        cached = pipeline.answer_cache.lookup(vector, source_ids, version)
+    if cached is None:
+        return None
+    return cached.model_copy(update={"cached": True})
+
+
+async def _store(
+    vector: Optional[List[float]],
+    documents: List[Document],
+    response: ChatResponse,
+    pipeline: Pipeline,
+) -> None:
+    """
+    Store a freshly generated answer in the answer cache.
+
+    :param vector: Query vector, None on the keyword fast path
+        unless cached
+    :param documents: Documents the answer was generated from
+    :param response: ChatResponse to store
+    :param pipeline: Pipeline object built at application startup
+    """
+    if pipeline.answer_cache is None or vector is None:
+        return
+
+    version = await pipeline.collection_version()
+    source_ids = [doc.metadata["id"] for doc in documents]
+    pipeline.answer_cache.store(vector, source_ids, version, response)
+
+
+def _response(answer: str, documents: List[Document]) -> ChatResponse:
+    """
+    :param answer: Generated answer
+    :param documents: Documents the answer was generated from
+    :returns: ChatResponse object
+    """
+    return ChatResponse(
+        answer=answer,
+        sources=[
+            Source(page_content=doc.page_content, metadata=doc.metadata)
+            for doc in documents
+        ],
+    )
@@ -0,0 +1,426 @@
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from cachetools import TTLCache
+from langchain.schema.embeddings import Embeddings
+from loguru import logger
+import numpy as np
+
+from ..utils.metrics import Histogram
+from .metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query for use as a cache key. Case and whitespace differences
+    do not change the meaning of a question, so they should not miss.
+
+    :param text: Raw query text
+    :returns: Normalized query text
+    """
+    return " ".join(text.split()).casefold()
+
+
+class VectorCache(ABC):
+    """
+    Interface for a single tier of the query embedding cache.
+    """
+
+    name: str
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[List[float]]:
+        """
+        :param key: Cache key
+        :returns: Cached vector or None when missing or expired
+        """
+
+    @abstractmethod
+    def set(self, key: str, vector: List[float]) -> None:
+        """
+        :param key: Cache key
+        :param vector: Vector to store
+        """
+
+    async def aget(self, key: str) -> Optional[List[float]]:
+        """
+        Async get, for tiers whose lookups would block the event loop.
+
+        :param key: Cache key
+        :returns: Cached vector or None when missing or expired
+        """
+        return self.get(key)
+
+    async def aset(self, key: str, vector: List[float]) -> None:
+        """
+        Async set, for tiers whose writes would block the event loop.
+
+        :param key: Cache key
+        :param vector: Vector to store
+        """
+        self.set(key, vector)
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryVectorCache(VectorCache):
+    """
+    In-process tier. Least recently used entries are evicted once `maxsize` is
+    reached and entries expire `ttl` seconds after they were stored.
+    """
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+        :param maxsize: Maximum number of vectors kept in memory
+        :param ttl: Time to live of an entry in seconds
+        """
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # the sync embedding path runs on the pipeline's worker threads
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._cache[key] = vector
+
+
+class DiskVectorCache(VectorCache):
+    """
+    SQLite backed tier that survives restarts. Vectors are stored as packed
+    float32 blobs. Embeddings are deterministic for a given text and model, so
+    entries do not expire.
+
+    The async methods keep SQLite off the event loop: lookups run on a
+    dedicated thread, and writes are queued and committed there in batches,
+    without the caller waiting for them. The event loop only ever takes the
+    lock of the write queue, never the one held around SQLite calls.
+    """
+
+    name = "disk"
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Path to the SQLite database file
+        """
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # readers do not block the writer of another worker process
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        # queued for the next flush, and being written by the current one,
+        # both readable meanwhile
+        self._queue_lock = threading.Lock()
+        self._pending: Dict[str, bytes] = {}
+        self._writing: Dict[str, bytes] = {}
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._queue_lock:
+            blob = self._pending.get(key) or self._writing.get(key)
+        if blob is None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                return None
+            blob = row[0]
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+
+    def set(self, key: str, vector: List[float]) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                (key, blob),
+            )
+            self._conn.commit()
+
+    async def aget(self, key: str) -> Optional[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.get, key)
+
+    async def aset(self, key: str, vector: List[float]) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._queue_lock:
+            flush = not self._pending
+            self._pending[key] = blob
+        # the writes queued until the flush runs share its commit
+        if flush:
+            self._executor.submit(self._flush)
+
+    def _flush(self) -> None:
+        with self._queue_lock:
+            self._writing, self._pending = self._pending, {}
+            rows = list(self._writing.items())
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    rows,
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write {len(rows)} cached embeddings: {e!r}")
+        finally:
+            with self._queue_lock:
+                self._writing = {}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._flush()
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper caching query vectors in front of another Embeddings
+    implementation. Keys are the normalized query text plus the model identity.
+    Tiers are checked in order and a hit in a slower tier is promoted to the
+    faster ones. Document embeddings are passed through untouched.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, model: str, tiers: List[VectorCache]
+    ) -> None:
+        """
+        :param embeddings: Underlying Embeddings implementation
+        :param model: Identity of the embedding model, part of the cache key
+        :param tiers: Cache tiers, fastest first
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.tiers = tiers
+        self.hits = {tier.name: 0 for tier in tiers}
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        payload = f"{self.model}\0{normalize_query(text)}".encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        for i, tier in enumerate(self.tiers):
+            vector = tier.get(key)
+            if vector is not None:
+                self.hits[tier.name] += 1
+                for faster in self.tiers[:i]:
+                    faster.set(key, vector)
+                return vector
+
+        self.misses += 1
+        return None
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        for tier in self.tiers:
+            tier.set(key, vector)
+
+    async def _alookup(self, key: str) -> Optional[List[float]]:
+        for i, tier in enumerate(self.tiers):
+            vector = await tier.aget(key)
+            if vector is not None:
+                self.hits[tier.name] += 1
+                for faster in self.tiers[:i]:
+                    await faster.aset(key, vector)
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def _astore(self, key: str, vector: List[float]) -> None:
+        for tier in self.tiers:
+            await tier.aset(key, vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        if (vector := self._lookup(key)) is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        if (vector := await self._alookup(key)) is None:
+            vector = await self.embeddings.aembed_query(text)
+            await self._astore(key, vector)
+        return vector
+
+    async def peek(self, text: str) -> Optional[List[float]]:
+        """
+        Cached vector of a query, without embedding it on a miss or counting
+        the lookup.
+
+        :param text: Query
+        :returns: Cached vector or None
+        """
+        key = self._key(text)
+        for tier in self.tiers:
+            if (vector := await tier.aget(key)) is not None:
+                return vector
+        return None
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries at once. Cached vectors are reused and the
+        distinct missing queries are embedded in a single call.
+
+        :param texts: Queries to embed
+        :returns: One vector per query, in order
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            if (vector := await self._alookup(key)) is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+
+        if missing:
+            embedded = await self.embeddings.aembed_documents(list(missing.values()))
+            for key, vector in zip(missing, embedded):
+                vectors[key] = vector
+                await self._astore(key, vector)
+        return [vectors[key] for key in keys]
+
+    def stats(self) -> dict:
+        """
+        :returns: Hit counts per tier, miss count and overall hit ratio
+        """
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        for tier in self.tiers:
+            tier.close()
+        # local models hold threads, remote ones have nothing to release
+        if hasattr(self.embeddings, "close"):
+            self.embeddings.close()
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper micro-batching async query embeddings. Queries arriving
+    within `window` seconds of the first pending one, or until `max_size` are
+    pending, are sent to the underlying model as a single batched call and the
+    vectors are fanned back out to the waiting callers. Synchronous calls are
+    passed through untouched.
+    """
+
+    def __init__(self, embeddings: Embeddings, window: float, max_size: int) -> None:
+        """
+        :param embeddings: Underlying Embeddings implementation
+        :param window: Seconds to wait for more queries before sending a batch
+        :param max_size: Number of pending queries that triggers a batch early
+        """
+        self.embeddings = embeddings
+        self.window = window
+        self.max_size = max_size
+        # exported in /metrics, and per instance in /api/stats
+        self.batch_sizes = Histogram(EMBEDDING_BATCH_SIZE.buckets)
+        self.wait_times = Histogram(EMBEDDING_BATCH_WAIT.buckets)
+
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        now = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        for _, _, queued in batch:
+            self.wait_times.observe(now - queued)
+            EMBEDDING_BATCH_WAIT.observe(now - queued)
+
+        task = asyncio.get_running_loop().create_task(self._embed(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _embed(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        try:
+            vectors = await self.embeddings.aembed_documents(
+                [text for text, _, _ in batch]
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            # callers may have been cancelled while the batch was in flight
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        """
+        :returns: Batch size and queue wait time (seconds) histograms
+        """
+        return {
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_seconds": self.wait_times.snapshot(),
+        }
+
+    def close(self) -> None:
+        if hasattr(self.embeddings, "close"):
+            self.embeddings.close()
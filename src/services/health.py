@@ -0,0 +1,85 @@
+from __future__ import annotations
+import asyncio
+from contextlib import contextmanager
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
+
+from loguru import logger
+
+from .metrics import STARTUP_SECONDS
+
+if TYPE_CHECKING:
+    from .pipeline import Pipeline
+
+
+class Startup:
+    """
+    State of the background startup. The server accepts connections as soon
+    as the light app module is imported, the heavy dependencies are imported
+    and the pipeline built and warmed up afterwards, while the health probes
+    already answer. The duration of every phase is kept for the readiness
+    probe and the metrics.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.pipeline: Optional[Pipeline] = None
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.pipeline is not None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a phase of the startup.
+
+        :param name: Name of the phase
+        """
+        start = time.perf_counter()
+        yield
+        elapsed = self.phases[name] = time.perf_counter() - start
+        STARTUP_SECONDS.set(elapsed, phase=name)
+        logger.info(f"Startup phase {name} took {elapsed * 1000:.1f} ms")
+
+
+def liveness(startup: Startup) -> dict:
+    """
+    :param startup: Startup object
+    :returns: Liveness report, not alive once the startup failed so the
+        process gets restarted
+    """
+    return {"alive": startup.error is None}
+
+
+async def readiness(startup: Startup, timeout: float = 2.0) -> dict:
+    """
+    :param startup: Startup object
+    :param timeout: Seconds to wait for Chroma to answer
+    :returns: Readiness report, ready once the pipeline is warmed up and
+        Chroma answers its heartbeat
+    """
+    report = {
+        "ready": False,
+        "pipeline": startup.ready,
+        "chroma": False,
+        "startup_ms": {
+            phase: round(seconds * 1000, 1) for phase, seconds in startup.phases.items()
+        },
+    }
+    if startup.pipeline is None:
+        return report
+
+    try:
+        await asyncio.wait_for(
+            startup.pipeline.run_blocking(startup.pipeline.retriever.heartbeat), timeout
+        )
+        report["chroma"] = True
+    except Exception as e:
+        logger.warning(f"Chroma heartbeat failed: {e!r}")
+
+    report["ready"] = report["chroma"]
+    return report
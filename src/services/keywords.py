@@ -0,0 +1,294 @@
+from collections import Counter
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+import numpy as np
+
+TOKEN = re.compile(r"\w+(?:[-.]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms. Hyphens and dots inside a term are
+    kept, so product names and error codes such as `E-104` stay whole.
+
+    :param text: Raw text
+    :returns: list of terms
+    """
+    return TOKEN.findall(text.casefold())
+
+
+def _pack(strings: Sequence[str]) -> np.ndarray:
+    # newline separated UTF-8, fixed width string arrays would pad every
+    # entry to the longest one
+    return np.frombuffer("\n".join(strings).encode(), dtype=np.uint8)
+
+
+def _unpack(array: np.ndarray) -> List[str]:
+    text = array.tobytes().decode()
+    return text.split("\n") if text else []
+
+
+class KeywordIndexBuilder:
+    """
+    Collects documents for a KeywordIndex. Only term counts and lengths are
+    kept, the document bodies stay in Chroma.
+    """
+
+    def __init__(self) -> None:
+        self.ids: List[str] = []
+        self.lengths: List[int] = []
+        self._seen = set()
+        self._vocabulary: Dict[str, int] = {}
+        self._terms: List[int] = []
+        self._documents: List[int] = []
+        self._counts: List[int] = []
+
+    def add(self, id: str, text: str) -> None:
+        """
+        :param id: Id of the document in the collection, added once
+        :param text: Text of the document
+        """
+        if id in self._seen:
+            return
+        self._seen.add(id)
+
+        terms = tokenize(text)
+        document = len(self.ids)
+        self.ids.append(id)
+        self.lengths.append(len(terms))
+        for term, count in Counter(terms).items():
+            self._terms.append(self._vocabulary.setdefault(term, len(self._vocabulary)))
+            self._documents.append(document)
+            self._counts.append(count)
+
+    def build(self, version: str) -> "KeywordIndex":
+        """
+        :param version: Version of the collection the documents were read from
+        :returns: KeywordIndex object
+        """
+        terms = np.array(self._terms, dtype=np.int32)
+        # postings grouped by term, documents ascending within a term
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(self._vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._vocabulary)), out=offsets[1:])
+
+        return KeywordIndex(
+            vocabulary=self._vocabulary,
+            offsets=offsets,
+            documents=np.array(self._documents, dtype=np.int32)[order],
+            counts=np.minimum(np.array(self._counts), 65535).astype(np.uint16)[order],
+            lengths=np.array(self.lengths, dtype=np.int32),
+            ids=self.ids,
+            version=version,
+        )
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over the chunks of the collection. Postings are
+    stored as flat arrays: the documents and term counts of term `t` are at
+    `offsets[t]:offsets[t + 1]`, so the index stays compact and a query is a
+    few vectorized operations per term.
+
+    The index is built by the ingestion script and stamped with the
+    collection version it was built at, results are only trusted while the
+    collection is at that version.
+    """
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        documents: np.ndarray,
+        counts: np.ndarray,
+        lengths: np.ndarray,
+        ids: Sequence[str],
+        version: str,
+    ) -> None:
+        """
+        :param vocabulary: Term to term number
+        :param offsets: Start of the postings of every term, and their end
+        :param documents: Document numbers of the postings
+        :param counts: Term counts of the postings
+        :param lengths: Number of terms of every document
+        :param ids: Collection id of every document
+        :param version: Collection version the index was built at
+        """
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.documents = documents
+        self.counts = counts
+        self.lengths = lengths
+        self.ids = list(ids)
+        self.version = version
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+        # length normalization of every document, per (k1, b)
+        self._norms: Dict[Tuple[float, float], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def norms(self, k1: float, b: float) -> np.ndarray:
+        """
+        BM25 length normalization of every document, computed once per
+        parameter pair.
+
+        :param k1: Term frequency saturation
+        :param b: Document length normalization
+        :returns: array of `k1 * (1 - b + b * length / average length)`
+        """
+        if (norms := self._norms.get((k1, b))) is None:
+            relative = self.lengths / max(self.average_length, 1.0)
+            norms = self._norms[(k1, b)] = (k1 * (1 - b + b * relative)).astype(
+                np.float32
+            )
+        return norms
+
+    def search(
+        self, query: str, n: int, k1: float, b: float
+    ) -> Tuple[List[Tuple[str, float]], float]:
+        """
+        Rank documents by BM25 score.
+
+        :param query: Query text
+        :param n: Maximum number of documents returned
+        :param k1: Term frequency saturation
+        :param b: Document length normalization
+        :returns: tuple of the (id, score) pairs of the best matching
+            documents, best first, and the confidence of the best one, from
+            0 to 1: the query terms it contains weighted by their inverse
+            document frequency, relative to every term being unique to it
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        total = len(self)
+        if not terms or not total:
+            return [], 0.0
+
+        scores = np.zeros(total, dtype=np.float32)
+        norms = self.norms(k1, b)
+        postings = []
+        for term in terms:
+            if (number := self.vocabulary.get(term)) is None:
+                continue
+            start, end = self.offsets[number], self.offsets[number + 1]
+            documents = self.documents[start:end]
+            counts = self.counts[start:end].astype(np.float32)
+            idf = math.log(1 + (total - len(documents) + 0.5) / (len(documents) + 0.5))
+            scores[documents] += idf * counts * (k1 + 1) / (counts + norms[documents])
+            postings.append((idf, documents))
+
+        n = min(n, total)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        hits = [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+        if not hits:
+            return [], 0.0
+
+        # documents are ascending within a term's postings
+        matched = sum(
+            idf
+            for idf, documents in postings
+            if documents[min(np.searchsorted(documents, top[0]), len(documents) - 1)]
+            == top[0]
+        )
+        unique = math.log(1 + (total - 0.5) / 1.5)
+        return hits, min(1.0, matched / (len(terms) * unique))
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to disk, replacing the previous file atomically.
+
+        :param path: Path of the index file
+        """
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                terms=_pack(terms),
+                offsets=self.offsets,
+                documents=self.documents,
+                counts=self.counts,
+                lengths=self.lengths,
+                ids=_pack(self.ids),
+                version=np.array(self.version),
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordIndex":
+        """
+        :param path: Path of the index file
+        :returns: KeywordIndex object
+        """
+        with np.load(os.path.expanduser(path)) as data:
+            return cls(
+                vocabulary={term: i for i, term in enumerate(_unpack(data["terms"]))},
+                offsets=data["offsets"],
+                documents=data["documents"],
+                counts=data["counts"],
+                lengths=data["lengths"],
+                ids=_unpack(data["ids"]),
+                version=str(data["version"]),
+            )
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Sequence[str]], k: int, constant: int
+) -> List[Tuple[str, float]]:
+    """
+    Merge rankings by summing 1 / (constant + rank) over the rankings each
+    id appears in. Ranks are comparable where raw scores of different
+    retrievers are not.
+
+    :param rankings: Rankings of ids, best first
+    :param k: Maximum number of ids returned
+    :param constant: Damping of the top ranks, 60 is customary
+    :returns: list of (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, 1):
+            scores[id] = scores.get(id, 0.0) + 1 / (constant + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def fuse(
+    documents: List[Document],
+    hits: List[Tuple[str, float]],
+    k: int,
+    constant: int,
+    fetched: Optional[Dict[str, Document]] = None,
+) -> List[Document]:
+    """
+    Merge vector search results with keyword hits through reciprocal rank
+    fusion. The `score` metadata of the merged documents is their fused score,
+    and their `scorer` is `hybrid`.
+
+    :param documents: Vector search results, best first
+    :param hits: Keyword hits, best first
+    :param k: Maximum number of documents returned
+    :param constant: RRF damping constant
+    :param fetched: Documents of the keyword hits missing from `documents`
+    :returns: list of Document objects, best first
+    """
+    known = {doc.metadata["id"]: doc for doc in documents}
+    known.update(fetched or {})
+    ranking = reciprocal_rank_fusion(
+        [[doc.metadata["id"] for doc in documents], [id for id, _ in hits]],
+        k,
+        constant,
+    )
+    return [
+        Document(
+            page_content=known[id].page_content,
+            metadata={**known[id].metadata, "score": score, "scorer": "hybrid"},
+        )
+        for id, score in ranking
+        if id in known
+    ]
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from ..utils.metrics import Counter, Gauge, HistogramMetric, Registry
+
+if TYPE_CHECKING:
+    from .pipeline import Pipeline
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(
+    HistogramMetric(
+        "http_request_duration_seconds",
+        "Time to produce the response headers, per route.",
+        labels=["method", "route", "status"],
+    )
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("http_requests_in_flight", "Requests currently being handled.")
+)
+STAGE_SECONDS = REGISTRY.register(
+    HistogramMetric(
+        "chat_stage_duration_seconds",
+        "Time spent in each stage of the chat pipeline.",
+        labels=["stage"],
+    )
+)
+EMBEDDING_BATCH_SIZE = REGISTRY.register(
+    HistogramMetric(
+        "embedding_batch_size",
+        "Queries per micro-batched embedding call.",
+        buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256],
+    )
+)
+EMBEDDING_BATCH_WAIT = REGISTRY.register(
+    HistogramMetric(
+        "embedding_batch_wait_seconds",
+        "Time a query waited for its embedding batch to be sent.",
+        buckets=[0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1],
+    )
+)
+LLM_IN_FLIGHT = REGISTRY.register(
+    Gauge("llm_calls_in_flight", "LLM calls holding a concurrency slot.")
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "llm_tokens_total",
+        "Prompt and completion tokens of generated answers.",
+        labels=["kind"],
+    )
+)
+ADMISSION_ACTIVE = REGISTRY.register(
+    Gauge("admission_active_requests", "Chat requests holding an admission slot.")
+)
+ADMISSION_QUEUED = REGISTRY.register(
+    Gauge("admission_queue_depth", "Chat requests waiting for an admission slot.")
+)
+ADMISSION_REJECTED = REGISTRY.register(
+    Counter(
+        "admission_rejections_total",
+        "Chat requests turned away, by reason.",
+        labels=["reason"],
+    )
+)
+SHARD_ERRORS = REGISTRY.register(
+    Counter(
+        "chroma_shard_errors_total",
+        "Chroma shard calls left out of a result, by shard and reason.",
+        labels=["shard", "reason"],
+    )
+)
+STARTUP_SECONDS = REGISTRY.register(
+    Gauge(
+        "startup_phase_duration_seconds",
+        "Time spent in each phase of the background startup.",
+        labels=["phase"],
+    )
+)
+
+
+async def metrics(pipeline: Pipeline) -> str:
+    """
+    Request, stage and token metrics plus the cache counters of the pipeline,
+    in the Prometheus text format.
+
+    :param pipeline: Pipeline object built at application startup
+    :returns: Prometheus exposition text
+    """
+    lookups = Counter(
+        "cache_lookups_total", "Cache lookups by result.", labels=["cache", "result"]
+    )
+    ratios = Gauge(
+        "cache_hit_ratio", "Cache hit ratio since startup.", labels=["cache"]
+    )
+
+    embedding_cache = pipeline.embeddings.stats()
+    for tier, hits in embedding_cache["hits"].items():
+        lookups.inc(hits, cache="embedding", result=f"hit_{tier}")
+    lookups.inc(embedding_cache["misses"], cache="embedding", result="miss")
+    ratios.set(embedding_cache["hit_ratio"], cache="embedding")
+
+    if pipeline.answer_cache is not None:
+        answer_cache = pipeline.answer_cache.stats()
+        lookups.inc(answer_cache["hits"], cache="answer", result="hit")
+        lookups.inc(answer_cache["misses"], cache="answer", result="miss")
+        ratios.set(answer_cache["hit_ratio"], cache="answer")
+
+    if pipeline.retrieval_cache is not None:
+        retrieval_cache = pipeline.retrieval_cache.stats()
+        lookups.inc(retrieval_cache["hits"], cache="retrieval", result="hit")
+        lookups.inc(retrieval_cache["misses"], cache="retrieval", result="miss")
+        ratios.set(retrieval_cache["hit_ratio"], cache="retrieval")
+
+    singleflight = pipeline.singleflight.stats()
+    shared = Counter(
+        "singleflight_calls_total",
+        "Chat pipeline runs started and joined.",
+        labels=["result"],
+    )
+    shared.inc(singleflight["started"], result="started")
+    shared.inc(singleflight["shared"], result="shared")
+
+    return REGISTRY.render([lookups, ratios, shared])
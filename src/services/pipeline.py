@@ -0,0 +1,394 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from typing import Any, Callable, Optional, TypeVar, Union
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+import httpx
+from langchain.chains.combine_documents.base import BaseCombineDocumentsChain
+from langchain.chains.question_answering import load_qa_chain
+from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema.embeddings import Embeddings
+from loguru import logger
+import openai
+import tiktoken
+
+from ..utils.config import (
+    ChatBatchConfig,
+    GlobalConfig,
+    KeywordConfig,
+    SourcesConfig,
+)
+from .cache import RetrievalCache, SemanticCache
+from .concurrency import SingleFlight
+from .context import ContextPacker, encode, encoding_for
+from .embeddings import (
+    BatchedEmbeddings,
+    CachedEmbeddings,
+    DiskVectorCache,
+    MemoryVectorCache,
+)
+from .keywords import KeywordIndex
+from .providers import create_embeddings, embedding_id
+from .retrieval import (
+    ShardedRetriever,
+    VectorRetriever,
+    create_client,
+    shard_configs,
+)
+
+T = TypeVar("T")
+
+
+class Pipeline:
+    """
+    Long-lived RAG pipeline. Holds the HTTP clients, vector store and chain
+    that used to be rebuilt on every request, so connection pools and TLS
+    sessions are reused for the lifetime of the process. Built once in the
+    application startup hook and closed at shutdown.
+
+    Blocking retrieval runs on a dedicated, sized thread pool and the number
+    of in-flight LLM calls is capped by a semaphore, so the event loop stays
+    free while requests wait on the network.
+    """
+
+    def __init__(
+        self,
+        chroma: Optional[chromadb.ClientAPI],
+        openai_client: Optional[openai.OpenAI],
+        async_openai_client: Optional[openai.AsyncOpenAI],
+        embeddings: CachedEmbeddings,
+        retriever: Union[VectorRetriever, ShardedRetriever],
+        keyword_config: KeywordConfig,
+        qa_chain: BaseCombineDocumentsChain,
+        stream_chain: BaseCombineDocumentsChain,
+        packer: ContextPacker,
+        answer_cache: Optional[SemanticCache],
+        retrieval_cache: Optional[RetrievalCache],
+        max_concurrency: int,
+        worker_threads: int,
+        stream_buffer: int,
+        batch: ChatBatchConfig,
+        sources: SourcesConfig,
+        version_interval: float,
+    ) -> None:
+        """
+        :param chroma: Chroma client used by the vector store, None when
+            sharded
+        :param openai_client: Pooled synchronous OpenAI client
+        :param async_openai_client: Pooled asynchronous OpenAI client
+        :param embeddings: Cached query embeddings
+        :param retriever: Retriever returning the documents for a query vector
+        :param keyword_config: Keyword index location and scoring parameters
+        :param qa_chain: Chain answering a query from the retrieved documents
+        :param stream_chain: Same chain backed by a token-streaming LLM
+        :param packer: Packs retrieved documents into the context budget
+        :param answer_cache: Optional semantic cache of previous answers
+        :param retrieval_cache: Optional cache of previous search results
+        :param max_concurrency: Maximum number of in-flight LLM calls
+        :param worker_threads: Size of the thread pool for blocking calls
+        :param stream_buffer: Number of tokens buffered per streaming client
+        :param batch: Parallelism and chunk size of batch requests
+        :param sources: How sources are returned and cached by clients
+        :param version_interval: Seconds between collection version checks
+        """
+        self.chroma = chroma
+        self.openai_client = openai_client
+        self.async_openai_client = async_openai_client
+        self.embeddings = embeddings
+        self.retriever = retriever
+        self.keyword_config = keyword_config
+        self.keywords: Optional[KeywordIndex] = None
+        self._keywords_mtime: Optional[float] = None
+        self.qa_chain = qa_chain
+        self.stream_chain = stream_chain
+        self.packer = packer
+        # tokens of the prompt template itself, without context or question
+        template = qa_chain.llm_chain.prompt.format(context="", question="")
+        self.prompt_overhead = len(encode(packer.encoding, template))
+        self.answer_cache = answer_cache
+        self.retrieval_cache = retrieval_cache
+        self.singleflight = SingleFlight()
+        self.llm_semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(
+            max_workers=worker_threads, thread_name_prefix="pipeline"
+        )
+        self.stream_buffer = stream_buffer
+        self.batch = batch
+        self.sources = sources
+        self.version_interval = version_interval
+        self._version = ""
+        self._version_checked = float("-inf")
+
+    async def run_blocking(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run a blocking callable on the pipeline's thread pool.
+
+        :param func: Callable to run
+        :param args: Positional arguments for the callable
+        :returns: The callable's return value
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def collection_version(self) -> str:
+        """
+        Version of the vector collection, refreshed at most every
+        `version_interval` seconds to keep it off the hot path.
+
+        :returns: version string
+        """
+        now = time.monotonic()
+        if now - self._version_checked >= self.version_interval:
+            self._version_checked = now
+            self._version = await self.run_blocking(self._refresh)
+        return self._version
+
+    async def keyword_index(self) -> Optional[KeywordIndex]:
+        """
+        The keyword index, when enabled and built at the current collection
+        version. An index lagging behind the collection would miss or point
+        at deleted documents, so it is not used until the ingestion script
+        rewrites it.
+
+        :returns: KeywordIndex object or None
+        """
+        version = await self.collection_version()
+        if self.keywords is None or self.keywords.version != version:
+            return None
+        return self.keywords
+
+    def _refresh(self) -> str:
+        """
+        Fetch the collection version and reload the keyword index if its
+        file changed. Blocking, run it on the pipeline's thread pool.
+
+        :returns: version string
+        """
+        version = self.retriever.version()
+        if not self.keyword_config.enabled:
+            return version
+
+        path = os.path.expanduser(self.keyword_config.path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._keywords_mtime:
+            return version
+
+        self._keywords_mtime = mtime
+        self.keywords = None
+        if mtime is None:
+            logger.warning(f"No keyword index at {path}, run chroma.script")
+            return version
+        try:
+            keywords = KeywordIndex.load(path)
+            # computed here, off the event loop, rather than by the first query
+            keywords.norms(self.keyword_config.k1, self.keyword_config.b)
+            self.keywords = keywords
+        except Exception as e:
+            logger.warning(f"Failed to load the keyword index at {path}: {e!r}")
+            return version
+
+        if self.keywords.version != version:
+            logger.warning(f"Keyword index at {path} is stale, run chroma.script")
+        else:
+            logger.info(f"Loaded keyword index of {len(self.keywords)} documents")
+        return version
+
+    async def warm_up(self) -> None:
+        """
+        Pay the costs of the first request before reporting ready: open
+        the embedding provider's connections (or load the local model), have
+        Chroma load the collection index and check the collection version.
+        Failures are logged, requests then pay these costs themselves.
+        """
+        start = time.perf_counter()
+        try:
+            await self.collection_version()
+            vector = await self.embeddings.aembed_query("warm up")
+            await self.run_blocking(self.retriever.search, vector)
+        except Exception as e:
+            logger.warning(f"Pipeline warm-up failed: {e!r}")
+            return
+
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"Pipeline warmed up in {elapsed:.1f} ms")
+
+    @classmethod
+    def from_config(cls, config: GlobalConfig) -> Pipeline:
+        """
+        Build the pipeline and its clients from the global configuration.
+
+        :param config: GlobalConfig object
+        :returns: Pipeline object
+        """
+        start = time.perf_counter()
+
+        # sharded retrievers build a client per replica
+        chroma = None if config.chromadb.shards else create_client(config.chromadb)
+
+        # one pooled client per flavour, shared by the LLM and the embeddings
+        openai_client = openai.OpenAI(http_client=httpx.Client())
+        async_openai_client = openai.AsyncOpenAI(http_client=httpx.AsyncClient())
+
+        embedding_model = create_embeddings(
+            config.embeddings, openai_client, async_openai_client
+        )
+
+        llm_kwargs = dict(
+            model=config.langchain.model,
+            client=openai_client.chat.completions,
+            async_client=async_openai_client.chat.completions,
+        )
+
+        pipeline = cls.from_components(
+            config,
+            chroma=chroma,
+            embedding_model=embedding_model,
+            llm=ChatOpenAI(**llm_kwargs),
+            stream_llm=ChatOpenAI(**llm_kwargs, streaming=True),
+            encoding=encoding_for(config.langchain.model),
+            openai_client=openai_client,
+            async_openai_client=async_openai_client,
+        )
+
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"Pipeline built in {elapsed:.1f} ms (setup previously paid on every request)"
+        )
+
+        return pipeline
+
+    @classmethod
+    def from_components(
+        cls,
+        config: GlobalConfig,
+        chroma: Optional[chromadb.ClientAPI],
+        embedding_model: Embeddings,
+        llm: BaseChatModel,
+        stream_llm: BaseChatModel,
+        encoding: tiktoken.Encoding,
+        openai_client: Optional[openai.OpenAI] = None,
+        async_openai_client: Optional[openai.AsyncOpenAI] = None,
+    ) -> Pipeline:
+        """
+        Assemble the pipeline around externally built backends. Caches,
+        batching, retrieval, chains and packing are configured from the
+        global configuration. Used by from_config and by the benchmarks to
+        plug in local stand-ins.
+
+        :param config: GlobalConfig object
+        :param chroma: Chroma client, None when shards are configured
+        :param embedding_model: Embeddings model for queries, matching the
+            configured provider
+        :param llm: Chat model answering queries
+        :param stream_llm: Token-streaming chat model answering queries
+        :param encoding: Tokenizer of the chat model
+        :param openai_client: Optional OpenAI client closed with the pipeline
+        :param async_openai_client: Optional AsyncOpenAI client closed with
+            the pipeline
+        :returns: Pipeline object
+        """
+        cache_config = config.embeddings.cache
+        tiers = []
+        if cache_config.enabled:
+            tiers.append(MemoryVectorCache(cache_config.maxsize, cache_config.ttl))
+            if cache_config.path is not None:
+                tiers.append(DiskVectorCache(cache_config.path))
+
+        batch_config = config.embeddings.batch
+        if batch_config.enabled:
+            embedding_model = BatchedEmbeddings(
+                embedding_model, batch_config.window_ms / 1000, batch_config.max_size
+            )
+
+        embeddings = CachedEmbeddings(
+            embedding_model, model=embedding_id(config.embeddings), tiers=tiers
+        )
+
+        if config.chromadb.shards:
+            retriever = ShardedRetriever(
+                shard_configs(config.chromadb),
+                config.chromadb.collection,
+                config.langchain.retrieval,
+                embedding=embedding_id(config.embeddings),
+                timeout=config.chromadb.shard_timeout,
+                min_shards=config.chromadb.min_shards,
+                max_workers=config.langchain.worker_threads
+                * len(config.chromadb.shards),
+            )
+        else:
+            retriever = VectorRetriever(
+                chroma,
+                config.chromadb.collection,
+                config.langchain.retrieval,
+                embedding=embedding_id(config.embeddings),
+            )
+
+        # the verbose chain prints every full prompt to stdout, debug only
+        qa_chain = load_qa_chain(
+            llm=llm, chain_type="stuff", verbose=config.logging.level == "DEBUG"
+        )
+        stream_chain = load_qa_chain(llm=stream_llm, chain_type="stuff")
+
+        budgets = config.langchain.context_tokens
+        packer = ContextPacker(
+            encoding, budgets.get(config.langchain.model, budgets["default"])
+        )
+
+        answers_config = config.cache.answers
+        answer_cache = None
+        if answers_config.enabled:
+            answer_cache = SemanticCache(
+                answers_config.threshold, answers_config.maxsize
+            )
+
+        retrieval_config = config.cache.retrieval
+        retrieval_cache = None
+        if retrieval_config.enabled:
+            retrieval_cache = RetrievalCache(
+                retrieval_config.maxsize,
+                config.chromadb.collection,
+                config.langchain.retrieval.to_dict(),
+            )
+
+        return cls(
+            chroma,
+            openai_client,
+            async_openai_client,
+            embeddings,
+            retriever,
+            config.langchain.keywords,
+            qa_chain,
+            stream_chain,
+            packer,
+            answer_cache,
+            retrieval_cache,
+            max_concurrency=config.langchain.max_concurrency,
+            worker_threads=config.langchain.worker_threads,
+            stream_buffer=config.langchain.stream_buffer,
+            batch=config.langchain.batch,
+            sources=config.sources,
+            version_interval=config.chromadb.version_interval,
+        )
+
+    async def close(self) -> None:
+        """
+        Release the pooled HTTP clients, the thread pool and stop the Chroma
+        client system.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if isinstance(self.retriever, ShardedRetriever):
+            self.retriever.close()
+        if self.async_openai_client is not None:
+            await self.async_openai_client.close()
+        if self.openai_client is not None:
+            self.openai_client.close()
+        self.embeddings.close()
+        SharedSystemClient.clear_system_cache()
@@ -0,0 +1,143 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+import hmac
+import json
+import os
+from typing import List, Optional, Set
+
+from loguru import logger
+
+from ..utils.config import ProfilingConfig
+from ..utils.profiling import SamplingProfiler, folded
+
+
+class _Session:
+    """
+    Profile covering a number of requests or a period of time.
+    """
+
+    def __init__(self, name: str, recording: Counter, remaining: Optional[int]) -> None:
+        self.name = name
+        self.recording = recording
+        self.remaining = remaining
+        self.requests: List[dict] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class Profiler:
+    """
+    On-demand sampling profiler for the live service. A session profiles the
+    next N requests or the next T seconds, whichever ends first, and a single
+    request can be profiled on its own. Each profile is written to `path` as
+    folded stacks for flame graph tools plus a JSON file with the wall and
+    CPU time of every profiled request.
+
+    Sessions and single-request profiles are guarded by the PROFILE_TOKEN
+    environment variable. Without it, only the signal handler can start a
+    session.
+    """
+
+    def __init__(self, config: ProfilingConfig) -> None:
+        """
+        :param config: ProfilingConfig object
+        """
+        self.config = config
+        self.path = os.path.expanduser(config.path)
+        self.sampler = SamplingProfiler(config.interval_ms / 1000)
+        self.token = os.environ.get("PROFILE_TOKEN")
+        self.session: Optional[_Session] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """
+        :param token: Token presented by the client
+        :returns: True if profiling is unlocked and the token matches
+        """
+        if not self.token or token is None:
+            return False
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def begin(
+        self, requests: Optional[int] = None, seconds: Optional[float] = None
+    ) -> str:
+        """
+        Start a session, unless one is already running.
+
+        :param requests: Number of requests to profile
+        :param seconds: Number of seconds to profile
+        :returns: Name of the running session
+        """
+        if self.session is not None:
+            return self.session.name
+        if requests is None and seconds is None:
+            requests, seconds = self.config.requests, self.config.seconds
+
+        # workers write to the same path, the pid keeps their names apart
+        name = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-session"
+        self.session = _Session(name, self.sampler.open(), requests)
+        if seconds is not None:
+            loop = asyncio.get_running_loop()
+            self.session.timer = loop.call_later(seconds, self.end)
+
+        logger.info(f"Profiling session {name} started")
+        return name
+
+    def end(self) -> None:
+        """
+        Stop the running session and write its profile.
+        """
+        session, self.session = self.session, None
+        if session is None:
+            return
+        if session.timer is not None:
+            session.timer.cancel()
+
+        self.sampler.close(session.recording)
+        task = asyncio.get_running_loop().create_task(
+            self.write(session.name, session.recording, session.requests)
+        )
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def observe(self, name: Optional[str], request: dict) -> None:
+        """
+        Count a finished request towards the session it started in.
+
+        :param name: Name of the session running when the request started
+        :param request: Wall and CPU times of the request
+        """
+        if (session := self.session) is None or session.name != name:
+            return
+        session.requests.append(request)
+        if session.remaining is not None:
+            session.remaining -= 1
+            if session.remaining <= 0:
+                self.end()
+
+    async def write(self, name: str, recording: Counter, requests: List[dict]) -> str:
+        """
+        Write a profile to disk off the event loop.
+
+        :param name: Name of the profile
+        :param recording: Counter of folded stacks
+        :param requests: Wall and CPU times of the profiled requests
+        :returns: Path of the folded stacks file
+        """
+        stacks = os.path.join(self.path, f"{name}.folded")
+        summary = {
+            "interval_ms": self.config.interval_ms,
+            "samples": sum(recording.values()),
+            "requests": requests,
+        }
+
+        def dump():
+            os.makedirs(self.path, exist_ok=True)
+            with open(stacks, "w") as f:
+                f.write(folded(recording))
+            with open(os.path.join(self.path, f"{name}.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+
+        await asyncio.to_thread(dump)
+        logger.info(f"Profile written to {stacks} ({summary['samples']} samples)")
+        return stacks
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import TYPE_CHECKING, List, Optional
+
+from langchain.schema.embeddings import Embeddings
+import numpy as np
+
+from ..utils.config import EmbeddingsConfig
+
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+    import openai
+
+# collections seeded before they were stamped were embedded with this
+LEGACY_EMBEDDING = "openai/text-embedding-ada-002"
+
+
+def embedding_id(config: EmbeddingsConfig) -> str:
+    """
+    Identity of the configured embedding provider and model. Stored in the
+    collection metadata at ingestion and checked before querying, vectors
+    from different models are not comparable.
+
+    :param config: EmbeddingsConfig object
+    :returns: `provider/model` string
+    """
+    return f"{config.provider}/{config.model}"
+
+
+def check_embedding(collection: Collection, expected: str) -> None:
+    """
+    :param collection: Chroma collection about to be queried or extended
+    :param expected: Embedding identity of the caller
+    :raises ValueError: if the collection was embedded by another provider
+    """
+    found = (collection.metadata or {}).get("embedding")
+    # unstamped collections are either empty or predate the stamp
+    if found is None and collection.count():
+        found = LEGACY_EMBEDDING
+    if found is not None and found != expected:
+        raise ValueError(
+            f"Collection '{collection.name}' was embedded with '{found}' but "
+            f"'{expected}' is configured, reseed it with --rebuild or switch "
+            "providers"
+        )
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Local sentence embeddings computed with onnxruntime, removing the remote
+    call from the query path. Expects a directory holding a transformer
+    exported as `model.onnx` and its `tokenizer.json`. Token embeddings are
+    mean pooled over the attention mask and normalized.
+
+    Inference runs on a single dedicated thread, onnxruntime parallelizes
+    each run over `threads` cores itself. Texts are sorted by length before
+    batching so each batch pads to a similar length.
+    """
+
+    def __init__(
+        self, path: str, threads: int, batch_size: int, max_length: int
+    ) -> None:
+        """
+        :param path: Directory holding model.onnx and tokenizer.json
+        :param threads: Number of threads used by one inference run
+        :param batch_size: Maximum number of texts per inference run
+        :param max_length: Texts are truncated to this many tokens
+        """
+        # only needed by this provider, imported when it is configured
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        path = os.path.expanduser(path)
+        self.batch_size = batch_size
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, "model.onnx"),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="onnx")
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+        }
+        if "token_type_ids" in self.inputs:
+            feed["token_type_ids"] = np.array(
+                [e.type_ids for e in encodings], dtype=np.int64
+            )
+
+        output = self.session.run(None, feed)[0]
+        # some exports already pool to one vector per text
+        if output.ndim == 3:
+            weights = mask[..., None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.maximum(
+                weights.sum(axis=1), 1e-9
+            )
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return output / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[List[float]] = [[] for _ in texts]
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start : start + self.batch_size]
+            for i, vector in zip(indices, self._run([texts[i] for i in indices])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_embeddings(
+    config: EmbeddingsConfig,
+    openai_client: Optional[openai.OpenAI] = None,
+    async_openai_client: Optional[openai.AsyncOpenAI] = None,
+) -> Embeddings:
+    """
+    Build the embedding model for the configured provider. Shared by the API
+    and the ingestion script, so documents and queries are always embedded
+    the same way.
+
+    :param config: EmbeddingsConfig object
+    :param openai_client: Optional pooled OpenAI client
+    :param async_openai_client: Optional pooled AsyncOpenAI client
+    :returns: Embeddings object
+    """
+    if config.provider == "openai":
+        from langchain.embeddings.openai import OpenAIEmbeddings
+
+        kwargs = {}
+        if openai_client is not None:
+            kwargs["client"] = openai_client.embeddings
+        if async_openai_client is not None:
+            kwargs["async_client"] = async_openai_client.embeddings
+        # user text may contain special tokens such as <|endoftext|>
+        return OpenAIEmbeddings(model=config.model, disallowed_special=(), **kwargs)
+    if config.provider == "onnx":
+        onnx = config.onnx
+        return OnnxEmbeddings(onnx.path, onnx.threads, onnx.batch_size, onnx.max_length)
+    raise ValueError(f"Unknown embeddings provider '{config.provider}'")
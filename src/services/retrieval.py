@@ -0,0 +1,466 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import replace
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Sequence
+
+import chromadb
+from chromadb.config import Settings
+from langchain.schema import Document
+from langchain.vectorstores.utils import maximal_marginal_relevance
+from loguru import logger
+import numpy as np
+
+from ..utils.config import ChromaConfig, RetrievalConfig
+from .metrics import SHARD_ERRORS
+from .providers import check_embedding
+
+
+def create_client(config: ChromaConfig) -> chromadb.ClientAPI:
+    """
+    Build a Chroma client for the configured mode. `http` talks to a Chroma
+    server, `persistent` opens the on-disk store in-process, which removes
+    the network hop and JSON round trip from every query.
+
+    :param config: ChromaConfig object
+    :returns: Chroma client
+    """
+    if config.mode == "persistent":
+        return chromadb.PersistentClient(path=os.path.expanduser(config.path))
+    if config.mode == "http":
+        return chromadb.HttpClient(
+            host=config.host,
+            port=config.port,
+            settings=Settings(chroma_api_impl="chromadb.api.fastapi.FastAPI"),
+        )
+    raise ValueError(f"Unknown chromadb mode '{config.mode}'")
+
+
+def shard_configs(config: ChromaConfig) -> List[List[ChromaConfig]]:
+    """
+    Connection settings of every replica of every configured shard.
+
+    :param config: ChromaConfig object with shards
+    :returns: ChromaConfig objects of the replicas, per shard
+    :raises ValueError: if shards are used outside of http mode or without
+        replicas
+    """
+    if config.mode != "http":
+        raise ValueError("Chroma shards require the http mode")
+    if not all(shard.replicas for shard in config.shards):
+        raise ValueError("Every Chroma shard needs at least one replica")
+    return [
+        [
+            replace(config, host=replica.host, port=replica.port, shards=None)
+            for replica in shard.replicas
+        ]
+        for shard in config.shards
+    ]
+
+
+def shard_of(id: str, shards: int) -> int:
+    """
+    :param id: Document id
+    :param shards: Number of shards
+    :returns: Index of the shard holding the document
+    """
+    digest = hashlib.sha256(id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def collection_version(collection: chromadb.Collection) -> str:
+    """
+    Fingerprint of the collection contents. Changes when the collection is
+    recreated, when the ingestion script bumps the `version` metadata or when
+    documents are added or removed. The ingestion script also stamps a
+    `revision` shared by all the collections it writes, which replaces the
+    collection id so that replicas report the same version.
+
+    :param collection: Chroma collection, freshly fetched
+    :returns: version string
+    """
+    metadata = collection.metadata or {}
+    origin = metadata.get("revision") or collection.id
+    return f"{origin}:{metadata.get('version', '')}:{collection.count()}"
+
+
+class VectorRetriever:
+    """
+    Similarity search against a Chroma collection using a precomputed query
+    vector. Unlike the LangChain retriever, results keep the document id and
+    similarity score in their metadata, which the caches key on.
+    """
+
+    def __init__(
+        self,
+        client: chromadb.ClientAPI,
+        name: str,
+        config: RetrievalConfig,
+        embedding: str,
+    ) -> None:
+        """
+        :param client: Chroma client
+        :param name: Name of the collection to query
+        :param config: RetrievalConfig object
+        :param embedding: Identity of the embedding provider used for queries
+        :raises ValueError: if the collection was embedded by another provider
+        """
+        self.client = client
+        self.name = name
+        self.config = config
+        self.embedding = embedding
+        self.collection = client.get_or_create_collection(name)
+        check_embedding(self.collection, embedding)
+
+    def _score(self, distance: float) -> float:
+        # chroma reports distances, convert to cosine similarity of unit vectors
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            return 1.0 - distance / 2
+        return 1.0 - distance
+
+    def search(self, vector: List[float]) -> List[Document]:
+        """
+        Return up to `k` documents for the query vector, either the nearest
+        ones or, with `search_type: mmr`, a diverse selection among the
+        `fetch_k` nearest. Documents scoring below `score_threshold` are
+        dropped. Blocking, run it on the pipeline's thread pool.
+
+        :param vector: Query embedding
+        :returns: list of Document objects with `id` and `score` metadata
+        """
+        return self.search_many([vector])[0]
+
+    def search_many(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """
+        Same as search for many query vectors, in a single Chroma query.
+        Blocking, run it on the pipeline's thread pool.
+
+        :param vectors: Query embeddings
+        :returns: one list of Document objects per query vector, in order
+        """
+        config = self.config
+        mmr = config.search_type == "mmr"
+        include = ["documents", "metadatas", "distances"]
+
+        result = self.collection.query(
+            query_embeddings=vectors,
+            n_results=config.fetch_k if mmr else config.k,
+            include=include + ["embeddings"] if mmr else include,
+        )
+
+        batches = []
+        for q, vector in enumerate(vectors):
+            indices = range(len(result["ids"][q]))
+            if mmr:
+                indices = maximal_marginal_relevance(
+                    np.array(vector, dtype=np.float32),
+                    result["embeddings"][q],
+                    lambda_mult=config.lambda_mult,
+                    k=config.k,
+                )
+
+            documents = []
+            for i in indices:
+                score = self._score(result["distances"][q][i])
+                if (
+                    config.score_threshold is not None
+                    and score < config.score_threshold
+                ):
+                    continue
+                documents.append(
+                    Document(
+                        page_content=result["documents"][q][i],
+                        metadata={
+                            **(result["metadatas"][q][i] or {}),
+                            "id": result["ids"][q][i],
+                            "score": score,
+                            "scorer": "vector",
+                        },
+                    )
+                )
+            batches.append(documents)
+        return batches
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Document]:
+        """
+        Fetch documents by id, without a similarity search. Blocking, run it
+        on the pipeline's thread pool.
+
+        :param ids: Document ids
+        :returns: Document objects with `id` metadata by id, missing ids are
+            left out
+        """
+        if not ids:
+            return {}
+        result = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return {
+            id: Document(page_content=document, metadata={**(metadata or {}), "id": id})
+            for id, document, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        }
+
+    def heartbeat(self) -> int:
+        """
+        Blocking, run it on the pipeline's thread pool.
+
+        :returns: Chroma server time in nanoseconds
+        """
+        return self.client.heartbeat()
+
+    def version(self) -> str:
+        """
+        Fingerprint of the collection contents, see collection_version. Also
+        picks up a recreated collection. Blocking, run it on the pipeline's
+        thread pool.
+
+        :returns: version string
+        :raises ValueError: if the collection was reseeded by another provider
+        """
+        self.collection = self.client.get_collection(self.name)
+        check_embedding(self.collection, self.embedding)
+        return collection_version(self.collection)
+
+
+class Replica:
+    """
+    A Chroma server holding a copy of a shard. Keeps a moving average of the
+    latency of its calls, failed calls count as a slow call and take the
+    replica out of rotation for `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        config: ChromaConfig,
+        retriever: Any,
+        penalty: float,
+        cooldown: float = 30.0,
+        alpha: float = 0.2,
+    ) -> None:
+        """
+        :param config: ChromaConfig object of the server
+        :param retriever: Callable building its VectorRetriever from a client
+        :param penalty: Latency in seconds recorded for a failed call
+        :param cooldown: Seconds a failed replica is avoided
+        :param alpha: Weight of the latest call in the moving average
+        """
+        self.config = config
+        self.address = f"{config.host}:{config.port}"
+        self.penalty = penalty
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.latency = 0.0
+        self.down_until = 0.0
+        self._factory = retriever
+        self._retriever = None
+
+    @property
+    def retriever(self) -> "VectorRetriever":
+        # connects on first use, a replica down at startup must not fail it
+        if self._retriever is None:
+            self._retriever = self._factory(create_client(self.config))
+        return self._retriever
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def observe(self, seconds: float) -> None:
+        self.latency += self.alpha * (seconds - self.latency)
+
+    def failed(self, now: float) -> None:
+        self.observe(self.penalty)
+        self.down_until = now + self.cooldown
+
+
+class ShardedRetriever:
+    """
+    VectorRetriever counterpart spreading the collection over several Chroma
+    servers. Every query goes to all shards at once, each to its available
+    replica with the lowest observed latency, falling back to the others on
+    errors. Results are merged by score. Shards answering later than
+    `timeout` or failing are left out of the result, as long as `min_shards`
+    answered. Documents are placed on shards by a hash of their id.
+    """
+
+    def __init__(
+        self,
+        shards: List[List[ChromaConfig]],
+        name: str,
+        config: RetrievalConfig,
+        embedding: str,
+        timeout: float,
+        min_shards: int,
+        max_workers: int,
+    ) -> None:
+        """
+        :param shards: ChromaConfig objects of the replicas, per shard
+        :param name: Name of the collection to query on every shard
+        :param config: RetrievalConfig object
+        :param embedding: Identity of the embedding provider used for queries
+        :param timeout: Seconds to wait for the shards
+        :param min_shards: Shards that must answer for a result to be served
+        :param max_workers: Size of the thread pool calling the shards
+        """
+        self.config = config
+        self.timeout = timeout
+        self.min_shards = min(min_shards, len(shards))
+        self.shards = [
+            [
+                Replica(
+                    replica,
+                    lambda client: VectorRetriever(client, name, config, embedding),
+                    penalty=timeout,
+                )
+                for replica in replicas
+            ]
+            for replicas in shards
+        ]
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="shards"
+        )
+        self._versions: Dict[int, str] = {}
+
+    def _call(self, shard: int, method: str, *args: Any) -> Any:
+        now = time.monotonic()
+        replicas = sorted(
+            self.shards[shard],
+            key=lambda replica: (not replica.available(now), replica.latency),
+        )
+        for replica in replicas:
+            start = time.monotonic()
+            try:
+                result = getattr(replica.retriever, method)(*args)
+            except Exception as e:
+                replica.failed(time.monotonic())
+                logger.warning(f"Chroma replica {replica.address} failed: {e!r}")
+                error = e
+                continue
+            replica.observe(time.monotonic() - start)
+            return result
+        raise error
+
+    def _fan_out(
+        self, method: str, calls: Dict[int, tuple], required: int
+    ) -> Dict[int, Any]:
+        """
+        Call a VectorRetriever method on several shards at once.
+
+        :param method: Name of the method
+        :param calls: Arguments of the call, per shard
+        :param required: Shards that must answer
+        :returns: Result per shard that answered in time
+        :raises RuntimeError: if fewer than `required` shards answered
+        """
+        futures = {
+            self.executor.submit(self._call, shard, method, *args): shard
+            for shard, args in calls.items()
+        }
+        done, pending = wait(futures, timeout=self.timeout)
+
+        results = {}
+        for future in done:
+            shard = futures[future]
+            try:
+                results[shard] = future.result()
+            except Exception:
+                SHARD_ERRORS.inc(shard=str(shard), reason="error")
+        for future in pending:
+            SHARD_ERRORS.inc(shard=str(futures[future]), reason="timeout")
+            logger.warning(f"Chroma shard {futures[future]} timed out")
+
+        if len(results) < required:
+            raise RuntimeError(
+                f"Only {len(results)} of {len(calls)} Chroma shards answered "
+                f"{method}, {required} required"
+            )
+        return results
+
+    def search(self, vector: List[float]) -> List[Document]:
+        """
+        See VectorRetriever.search.
+
+        :param vector: Query embedding
+        :returns: list of Document objects with `id` and `score` metadata
+        """
+        return self.search_many([vector])[0]
+
+    def search_many(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """
+        See VectorRetriever.search_many. Every shard returns its own best
+        `k` documents, the best `k` overall are kept. With `search_type:
+        mmr` the diversity selection is made per shard.
+
+        :param vectors: Query embeddings
+        :returns: one list of Document objects per query vector, in order
+        """
+        calls = {shard: (vectors,) for shard in range(len(self.shards))}
+        results = self._fan_out("search_many", calls, self.min_shards)
+
+        merged = []
+        for q in range(len(vectors)):
+            documents = [doc for batches in results.values() for doc in batches[q]]
+            documents.sort(key=lambda doc: doc.metadata["score"], reverse=True)
+            merged.append(documents[: self.config.k])
+        return merged
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Document]:
+        """
+        See VectorRetriever.get. Only the shards holding the ids are asked,
+        documents of shards that did not answer are left out.
+
+        :param ids: Document ids
+        :returns: Document objects with `id` metadata by id
+        """
+        calls: Dict[int, tuple] = {}
+        for id in ids:
+            calls.setdefault(shard_of(id, len(self.shards)), ([],))[0].append(id)
+        if not calls:
+            return {}
+
+        documents = {}
+        for found in self._fan_out("get", calls, 0).values():
+            documents.update(found)
+        return documents
+
+    def heartbeat(self) -> int:
+        """
+        :returns: Highest server time of the shards that answered
+        :raises RuntimeError: if fewer than `min_shards` shards answered
+        """
+        calls = {shard: () for shard in range(len(self.shards))}
+        return max(self._fan_out("heartbeat", calls, self.min_shards).values())
+
+    def version(self) -> str:
+        """
+        Versions of all shards, see VectorRetriever.version. The last known
+        version stands in for a shard that does not answer.
+
+        :returns: version string
+        """
+        calls = {shard: () for shard in range(len(self.shards))}
+        self._versions.update(self._fan_out("version", calls, 0))
+        return "|".join(
+            self._versions.get(shard, "?") for shard in range(len(self.shards))
+        )
+
+    def stats(self) -> dict:
+        """
+        :returns: Latency moving average (ms) and availability per replica,
+            per shard
+        """
+        now = time.monotonic()
+        return {
+            str(shard): {
+                replica.address: {
+                    "latency_ms": round(replica.latency * 1000, 1),
+                    "available": replica.available(now),
+                }
+                for replica in replicas
+            }
+            for shard, replicas in enumerate(self.shards)
+        }
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, AsyncIterator
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+
+class TokenStreamHandler(AsyncCallbackHandler):
+    """
+    Callback handler forwarding LLM tokens to a bounded queue. The LLM stream
+    awaits free space in the queue, so a slow client slows down the upstream
+    read instead of the whole answer being buffered in memory.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """
+        :param maxsize: Maximum number of tokens buffered for the client
+        """
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            await self.queue.put(token)
+
+    async def aiter(self, task: asyncio.Task) -> AsyncIterator[str]:
+        """
+        Yield tokens as they arrive until the generating task has finished
+        and the queue is drained.
+
+        :param task: Task running the chain this handler is attached to
+        """
+        while not (task.done() and self.queue.empty()):
+            getter = asyncio.ensure_future(self.queue.get())
+            try:
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                getter.cancel()
+                raise
+
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
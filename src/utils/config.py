@@ -25,7 +25,13 @@ class GlobalConfig(DataClassYAMLMixin):
     uvicorn: UvicornConfig
     cors_middleware: CORSMiddlewareConfig
     langchain: LangchainConfig
+    embeddings: EmbeddingsConfig
     chromadb: ChromaConfig
+    cache: CacheConfig
+    sources: SourcesConfig
+    profiling: ProfilingConfig
+    compression: CompressionConfig
+    admission: AdmissionConfig
 
 
 @dataclass
@@ -35,12 +41,21 @@ class LoggingConfig(DataClassDictMixin):
     enqueue: bool
     backtrace: bool
     diagnose: bool
+    format: str
+    queue_size: Optional[int]
+    sampling: dict[str, float]
 
 
 @dataclass
 class UvicornConfig(DataClassDictMixin):
     host: str
     port: int
+    workers: Optional[int]
+    loop: str
+    http: str
+    backlog: int
+    timeout_keep_alive: int
+    limit_concurrency: Optional[int]
 
 
 @dataclass
@@ -51,12 +66,162 @@ class CORSMiddlewareConfig(DataClassDictMixin):
     allow_headers: list[str]
 
 
+@dataclass
+class RetrievalConfig(DataClassDictMixin):
+    k: int
+    search_type: str
+    fetch_k: int
+    lambda_mult: float
+    score_threshold: Optional[float]
+
+
+@dataclass
+class KeywordFastPathConfig(DataClassDictMixin):
+    enabled: bool
+    max_terms: int
+    min_confidence: float
+
+
+@dataclass
+class KeywordConfig(DataClassDictMixin):
+    enabled: bool
+    path: str
+    k1: float
+    b: float
+    rrf_k: int
+    fast_path: KeywordFastPathConfig
+
+
+@dataclass
+class ChatBatchConfig(DataClassDictMixin):
+    parallelism: int
+    chunk_size: int
+
+
 @dataclass
 class LangchainConfig(DataClassDictMixin):
     model: str
+    max_concurrency: int
+    worker_threads: int
+    stream_buffer: int
+    batch: ChatBatchConfig
+    retrieval: RetrievalConfig
+    keywords: KeywordConfig
+    context_tokens: dict[str, int]
+
+
+@dataclass
+class EmbeddingCacheConfig(DataClassDictMixin):
+    enabled: bool
+    maxsize: int
+    ttl: float
+    path: Optional[str]
+
+
+@dataclass
+class EmbeddingBatchConfig(DataClassDictMixin):
+    enabled: bool
+    window_ms: float
+    max_size: int
+
+
+@dataclass
+class OnnxEmbeddingConfig(DataClassDictMixin):
+    path: str
+    threads: int
+    batch_size: int
+    max_length: int
+
+
+@dataclass
+class EmbeddingsConfig(DataClassDictMixin):
+    provider: str
+    model: str
+    onnx: OnnxEmbeddingConfig
+    cache: EmbeddingCacheConfig
+    batch: EmbeddingBatchConfig
+
+
+@dataclass
+class ChromaReplicaConfig(DataClassDictMixin):
+    host: str
+    port: int
+
+
+@dataclass
+class ChromaShardConfig(DataClassDictMixin):
+    replicas: list[ChromaReplicaConfig]
 
 
 @dataclass
 class ChromaConfig(DataClassDictMixin):
+    mode: str
     host: str
     port: int
+    path: str
+    collection: str
+    version_interval: float
+    shards: Optional[list[ChromaShardConfig]]
+    shard_timeout: float
+    min_shards: int
+
+
+@dataclass
+class AnswerCacheConfig(DataClassDictMixin):
+    enabled: bool
+    threshold: float
+    maxsize: int
+
+
+@dataclass
+class RetrievalCacheConfig(DataClassDictMixin):
+    enabled: bool
+    maxsize: int
+
+
+@dataclass
+class CacheConfig(DataClassDictMixin):
+    answers: AnswerCacheConfig
+    retrieval: RetrievalCacheConfig
+
+
+@dataclass
+class SourcesConfig(DataClassDictMixin):
+    references: bool
+    max_age: int
+
+
+@dataclass
+class ProfilingConfig(DataClassDictMixin):
+    enabled: bool
+    path: str
+    interval_ms: float
+    requests: Optional[int]
+    seconds: Optional[float]
+
+
+@dataclass
+class CompressionConfig(DataClassDictMixin):
+    enabled: bool
+    minimum_size: int
+    gzip_level: int
+    brotli_quality: int
+
+
+@dataclass
+class RateLimitConfig(DataClassDictMixin):
+    enabled: bool
+    rate: float
+    burst: int
+    client_header: Optional[str]
+    trusted_hops: int
+    max_clients: int
+
+
+@dataclass
+class AdmissionConfig(DataClassDictMixin):
+    enabled: bool
+    max_active: int
+    max_queue: int
+    max_wait: float
+    rate_limit: RateLimitConfig
@@ -1,11 +1,22 @@
 from contextlib import contextmanager
-import inspect
+from contextvars import ContextVar
+import json
 import logging
+import queue
+import random
 import sys
-from typing import Generator, Optional
+import threading
+import traceback
+from typing import Dict, Generator, Optional, TextIO
 
 from loguru import logger
 
+# correlation id of the request being handled, set by the request middleware
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# log file opened by construct_logger, closed when it is called again
+_file: Optional[TextIO] = None
+
 
 class LoggerStream:
     """
@@ -16,7 +27,7 @@ class LoggerStream:
     capture `print` statements and forward them to loguru.
 
     NOTE: The module and line number of the caller will be captured and included in
-    the log message!
+    the log message, at the cost of a single frame lookup!
 
     Attributes:
         level (str): The log level at which messages will be logged.
@@ -32,25 +43,9 @@ class LoggerStream:
 
     def write(self, message: str) -> None:
         if message := message.rstrip():
-            # Get the frame that called print()
-            frame = inspect.currentframe()
-            while frame:
-                frame = frame.f_back
-                if frame.f_globals["__name__"] != __name__:
-                    break
-
-            # Extract necessary information from the frame
-            # This fixes bug when using this class with enqueued log messages
-            frame_info = {
-                "filename": frame.f_code.co_filename,
-                "line_no": frame.f_lineno,
-                "function": frame.f_code.co_name,
-            }
-
-            # Use the captured frame info for logging context
-            logger.bind(captured_frame_info=frame_info).opt(depth=1).log(
-                self.level, message
-            )
+            # print() is implemented in C, so the frame above this one is the
+            # caller of print and loguru can find it by depth alone
+            logger.opt(depth=1).log(self.level, message)
 
     def flush(self) -> None:
         pass
@@ -81,6 +76,10 @@ def capture_prints(level: str = "PRINT") -> Generator:
         sys.stdout = original_stdout
 
 
+TEXT_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>\n"
+MULTILINE_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>\n{message}</level>\n"
+
+
 def custom_format(record) -> str:
     """
     Custom log formatter function. Maintains the default loguru format but splits
@@ -96,14 +95,134 @@ def custom_format(record) -> str:
     :param record: Dictionary containing log details.
     :return: Formatted log string.
     """
-    # Check if the message contains line breaks
-    if "\n" in record["message"]:
-        # Modify the format to start the message on a new line
-        format_string = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>\n{message}</level>\n"
-    else:
-        format_string = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>\n"
+    # both formats are constants, only pick one per record
+    return MULTILINE_FORMAT if "\n" in record["message"] else TEXT_FORMAT
+
+
+def json_line(record) -> str:
+    """
+    Serialize a loguru record as a single JSON line.
+
+    :param record: Dictionary containing log details.
+    :return: JSON encoded log line.
+    """
+    extra = record["extra"]
+    line = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "request_id": extra.get("request_id"),
+    }
+    if len(extra) > 1:
+        line["extra"] = {k: v for k, v in extra.items() if k != "request_id"}
+    if record["exception"] is not None:
+        exception = record["exception"]
+        line["exception"] = f"{exception.type.__name__}: {exception.value}"
+        line["traceback"] = "".join(
+            traceback.format_exception(
+                exception.type, exception.value, exception.traceback
+            )
+        )
+    return json.dumps(line, default=str) + "\n"
+
+
+class QueueSink:
+    """
+    Loguru sink handing messages to a background writer thread through a
+    bounded queue, so logging never waits on disk or terminal I/O. Messages
+    are formatted by the writer thread, and written in batches with a single
+    flush per batch. When the queue is full, messages are dropped and
+    counted instead of blocking the caller.
+    """
+
+    def __init__(self, stream: TextIO, serialize: bool, maxsize: int) -> None:
+        """
+        :param stream: Text stream to write to
+        :param serialize: Bool flag for writing JSON lines instead of the
+            preformatted message
+        :param maxsize: Maximum number of queued messages
+        """
+        self.stream = stream
+        self.serialize = serialize
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="logging", daemon=True)
+        self._thread.start()
+
+    def write(self, message) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for message in batch:
+                if message is None:
+                    self.stream.flush()
+                    return
+                self.stream.write(
+                    json_line(message.record) if self.serialize else message
+                )
+
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.stream.write(f"{dropped} log messages dropped, queue full\n")
+            self.stream.flush()
+
+    def stop(self) -> None:
+        """
+        Write the queued messages and stop the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+def json_sink(stream: TextIO):
+    """
+    Build a loguru sink writing JSON lines straight to a stream, flushed per
+    record like loguru's own stream sinks.
+
+    :param stream: Text stream to write to
+    :return: Sink function
+    """
+
+    def write(message) -> None:
+        stream.write(json_line(message.record))
+        stream.flush()
+
+    return write
+
+
+def sampler(rates: Dict[str, float]):
+    """
+    Build a loguru filter keeping only a fraction of the records of the given
+    levels, e.g. {"DEBUG": 0.01} keeps one debug record in a hundred.
+
+    :param rates: Fraction of records kept, per level name
+    :return: Filter function
+    """
+
+    def keep(record) -> bool:
+        rate = rates.get(record["level"].name)
+        return rate is None or random.random() < rate
+
+    return keep
+
+
+def _patch(record) -> None:
+    record["extra"]["request_id"] = request_id.get()
 
-    return format_string
 
 class InterceptHandler(logging.Handler):
     """
@@ -116,21 +235,12 @@ class InterceptHandler(logging.Handler):
         except ValueError:
             level = record.levelno
 
-        frame = logging.currentframe()
-        depth = 0
-        while frame:
-            if (
-                frame.f_code.co_filename == logging.__file__
-                or frame.f_code.co_filename == __file__
-            ):
-                frame = frame.f_back
-                depth += 1
-                continue
-            break
-
-        logger.opt(depth=depth, exception=record.exc_info).log(
-            level, record.getMessage()
-        )
+        # the record already knows its caller, no need to walk the stack
+        logger.patch(
+            lambda r: r.update(
+                name=record.name, function=record.funcName, line=record.lineno
+            )
+        ).opt(exception=record.exc_info).log(level, record.getMessage())
 
 
 def construct_logger(
@@ -139,27 +249,38 @@ def construct_logger(
     enqueue: bool = False,
     backtrace: bool = False,
     diagnose: bool = False,
+    format: str = "text",
+    queue_size: Optional[int] = None,
+    sampling: Optional[Dict[str, float]] = None,
 ) -> None:
     """
     Function to set up the Loguru logger.
 
-    NOTE: If `buffer` is set to True make sure a file sink is added later on and
-        the buffer is cleared. Otherwise, a memory leak will occur.
+    For production use `format: json` with a `queue_size`. Records are then
+    written as JSON lines carrying the request id by a background thread, and
+    logging never blocks the event loop.
 
     :param level: Log level to use. See Loguru documentation for more details.
     :param path: Path to the log file. If None, logs will be printed to stderr.
-    :param buffer: Bool flag for using a buffer sink. If True, you can delay the
-        log file creation until some later time. This is useful if you want to
-        log to a file but don't know the path yet.
     :param enqueue: Bool flag for enqueuing messages. Allows logging with
         multiple processes.
     :param backtrace: Bool flag for including backtrace in log messages. High
         performance impact, use with caution.
     :param diagnose: Bool flag for including diagnostic information in log
         messages. High performance impact, use with caution.
+    :param format: `text` for the colored human readable format, `json` for
+        one JSON object per line.
+    :param queue_size: If set, messages are written by a background thread
+        holding at most this many pending messages. Overflow is dropped.
+    :param sampling: Fraction of records kept per level, e.g. {"DEBUG": 0.01}
     """
-    # Remove all default sinks
+    global _file
+
+    # Remove all default sinks, background writers write what they hold
     logger.remove()
+    if _file is not None:
+        _file.close()
+        _file = None
 
     # add custom log level for captured print statements (if it doesn't already exist)
     try:
@@ -167,29 +288,40 @@ def construct_logger(
     except ValueError:
         logger.level("PRINT", no=25, color="<white>", icon="󰐪")
 
+    # tag every record with the id of the request being handled
+    logger.configure(patcher=_patch)
+
     # forward logs from the standard library to loguru
-    logging.basicConfig(handlers=[InterceptHandler()], level=level)
+    logging.basicConfig(handlers=[InterceptHandler()], level=level, force=True)
 
-    # recreate the stderr handler with the desired log level and enqueue
+    streams = [sys.stderr]
     if path is not None:
+        # flushed per record, or per batch by a background writer
+        _file = open(path, "a", buffering=1 << 16)
+        streams.insert(0, _file)
+
+    serialize = format == "json"
+    for stream in streams:
+        if queue_size is not None:
+            sink = QueueSink(stream, serialize, queue_size)
+        elif serialize:
+            sink = json_sink(stream)
+        else:
+            sink = stream
+
         logger.add(
-            sink=path,
+            sink=sink,
             level=level,
-            enqueue=enqueue,
+            # a background writer replaces loguru's own queue
+            enqueue=enqueue and queue_size is None,
             backtrace=backtrace,
             diagnose=diagnose,
-            format=custom_format,
+            # json lines are built from the record, skip loguru's formatting
+            format="{message}" if serialize else custom_format,
+            filter=sampler(sampling) if sampling else None,
+            colorize=not serialize and stream.isatty(),
         )
 
-    logger.add(
-        sink=sys.stderr,
-        level=level,
-        enqueue=enqueue,
-        backtrace=backtrace,
-        diagnose=diagnose,
-        format=custom_format,
-    )
-
 
 @contextmanager
 def suppress_logs():
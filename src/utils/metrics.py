@@ -0,0 +1,254 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import accumulate
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# seconds, from a cached embedding lookup up to a slow LLM completion
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket upper bounds. Counts are kept per bucket and
+    reported cumulatively, Prometheus style, with a final +Inf bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        """
+        :param buckets: Upper bounds of the buckets
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: Observed value
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """
+        :returns: Cumulative bucket counts keyed by upper bound, total count
+            and sum of observed values
+        """
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(bounds, accumulate(self.counts))),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class Metric:
+    """
+    Base of the labelled metric families rendered in the Prometheus text
+    exposition format. Updates are plain attribute arithmetic without locks,
+    cheap enough for the request path. They happen on the event loop, where
+    they cannot interleave.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """
+        :param name: Metric name
+        :param documentation: Help text
+        :param labels: Label names, values are passed as keyword arguments
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        :returns: Metric family in the Prometheus text format
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value per label set.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{self._format(key)} {value}"
+
+
+class Gauge(Counter):
+    """
+    Value per label set that can go up and down.
+    """
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[self._key(labels)] = value
+
+
+class HistogramMetric(Metric):
+    """
+    Histogram per label set, sharing the same bucket bounds.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self.histograms: Dict[Tuple[str, ...], Histogram] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def samples(self) -> Iterator[str]:
+        for key, histogram in self.histograms.items():
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                labels = self._format(key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            yield f"{self.name}_sum{self._format(key)} {snapshot['sum']}"
+            yield f"{self.name}_count{self._format(key)} {snapshot['count']}"
+
+
+class Registry:
+    """
+    Collection of metric families rendered together.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, extra: Sequence[Metric] = ()) -> str:
+        """
+        :param extra: Metrics computed at scrape time, rendered after the
+            registered ones
+        :returns: All metric families in the Prometheus text format
+        """
+        return "".join(metric.render() for metric in [*self.metrics, *extra])
+
+
+class Timings:
+    """
+    Durations of the stages of a single request, in the order they ran.
+    Rendered as a Server-Timing header value.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, other: "Timings") -> None:
+        """
+        :param other: Timings whose stages are added to these
+        """
+        for stage, seconds in other.stages.items():
+            self.add(stage, seconds)
+
+    def elapsed(self) -> float:
+        """
+        :returns: Seconds since the request started
+        """
+        return time.perf_counter() - self.start
+
+    def header(self) -> str:
+        """
+        :returns: Server-Timing header value with durations in milliseconds
+        """
+        entries = [*self.stages.items(), ("total", self.elapsed())]
+        return ", ".join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in entries
+        )
+
+
+# timings of the request being handled, set by the timing middleware
+current_timings: ContextVar[Optional[Timings]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+@contextmanager
+def timed(histogram: HistogramMetric, stage: str) -> Iterator[None]:
+    """
+    Time a block, observing the duration in the histogram under the `stage`
+    label and recording it in the current request's Server-Timing.
+
+    :param histogram: Histogram labelled by stage
+    :param stage: Name of the stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, stage=stage)
+        if (timings := current_timings.get()) is not None:
+            timings.add(stage, elapsed)
@@ -0,0 +1,98 @@
+from collections import Counter
+import os
+import sys
+import threading
+import time
+from types import FrameType
+from typing import List
+
+# idle pool workers park in these modules, their samples are noise
+IDLE_MODULES = (
+    os.path.join("concurrent", "futures", "thread.py"),
+    "threading.py",
+    "queue.py",
+)
+
+
+def _fold(thread: str, frame: FrameType) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    stack.append(thread)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of every thread from a
+    background thread. Samples are aggregated as folded stacks, one
+    `thread;outer;...;inner count` line per distinct stack, the input format
+    of flamegraph.pl and speedscope.
+
+    Samples are only taken while at least one recording is open. The thread
+    exits when the last one closes, so an idle profiler costs nothing.
+    """
+
+    def __init__(self, interval: float) -> None:
+        """
+        :param interval: Seconds between two samples
+        """
+        self.interval = interval
+        self._recordings: List[Counter] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def open(self) -> Counter:
+        """
+        Start a recording, starting the sampling thread if needed.
+
+        :returns: Counter of folded stacks filled until the recording is closed
+        """
+        recording = Counter()
+        with self._lock:
+            self._recordings.append(recording)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+        return recording
+
+    def close(self, recording: Counter) -> None:
+        """
+        :param recording: Recording returned by open
+        """
+        with self._lock:
+            # by identity, recordings with the same samples compare equal
+            self._recordings = [r for r in self._recordings if r is not recording]
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            samples = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                samples.append(_fold(names.get(ident, str(ident)), frame))
+
+            with self._lock:
+                if not self._recordings:
+                    self._thread = None
+                    return
+                for recording in self._recordings:
+                    recording.update(samples)
+
+            time.sleep(self.interval)
+
+
+def folded(recording: Counter) -> str:
+    """
+    :param recording: Counter of folded stacks
+    :returns: Folded stacks text, heaviest stacks first
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in recording.most_common())
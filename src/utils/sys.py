@@ -1,15 +1,39 @@
-import logging
-import sys
+import math
+import multiprocessing
+import os
 from types import FrameType
 from typing import Optional
 
 
-def cleanup(signum: int, frame: Optional[FrameType]) -> None:
+def forward(signum: int, frame: Optional[FrameType]) -> None:
     """
-    Helper function to handle signals and exit gracefully.
+    Helper function relaying a signal to every worker process, for signals
+    the workers handle themselves (e.g. the profiling signals).
 
     :param signum: The signal number
     :param frame: The interrupted stack frame
     """
-    logging.info("Received signal:", signum, ". Cleaning up...")
-    sys.exit(0)
+    for child in multiprocessing.active_children():
+        os.kill(child.pid, signum)
+
+
+def available_cpus() -> int:
+    """
+    Number of CPUs this process can use: the CPUs it may be scheduled on,
+    capped by the cgroup CPU quota container runtimes set for CPU limits.
+
+    :returns: Number of CPUs, at least 1
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
@@ -0,0 +1,56 @@
+from typing import Optional
+
+from fastapi import FastAPI, Header
+from fastapi.testclient import TestClient
+import pytest
+
+from src.common.middleware import CompressionMiddleware
+from src.common.responses import cacheable_response
+from src.utils.config import CompressionConfig
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    config = CompressionConfig(
+        enabled=True, minimum_size=100, gzip_level=6, brotli_quality=4
+    )
+    app.add_middleware(CompressionMiddleware, config=config)
+
+    @app.get("/large")
+    async def large(if_none_match: Optional[str] = Header(None)):
+        return cacheable_response({"text": "x" * 500}, if_none_match, 60)
+
+    @app.get("/small")
+    async def small(if_none_match: Optional[str] = Header(None)):
+        return cacheable_response({"text": "x"}, if_none_match, 60)
+
+    return TestClient(app)
+
+
+def test_revalidated_etag_keeps_the_encoding(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    revalidated = client.get(
+        "/large", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.headers["Vary"] == "Accept-Encoding"
+
+
+def test_uncompressed_responses_vary_on_encoding(client):
+    identity = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["Vary"] == "Accept-Encoding"
+    assert not identity.headers["ETag"].endswith('-gzip"')
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+    assert small.headers["Vary"] == "Accept-Encoding"
+    # a different representation than the one sent without gzip
+    assert small.headers["ETag"].endswith('-gzip"')
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from src.services.embeddings import DiskVectorCache
+
+
+class SlowConnection:
+    """
+    sqlite3 connection whose batched writes take `delay` seconds.
+    """
+
+    def __init__(self, conn, delay: float) -> None:
+        self.conn = conn
+        self.delay = delay
+
+    def executemany(self, *args):
+        time.sleep(self.delay)
+        return self.conn.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_disk_cache_flush_does_not_block_event_loop(tmp_path):
+    cache = DiskVectorCache(str(tmp_path / "embeddings.sqlite"))
+    cache._conn = SlowConnection(cache._conn, delay=0.5)
+
+    async def main() -> float:
+        await cache.aset("a", [1.0, 2.0])
+        # let the flush start and hold the connection
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        await cache.aset("b", [3.0, 4.0])
+        blocked = time.perf_counter() - start
+        # queued and in-flight writes are readable before they are committed
+        assert await cache.aget("a") == [1.0, 2.0]
+        return blocked
+
+    try:
+        assert asyncio.run(main()) < 0.05
+    finally:
+        cache.close()
+
+    cache = DiskVectorCache(str(tmp_path / "embeddings.sqlite"))
+    try:
+        assert cache.get("a") == [1.0, 2.0]
+        assert cache.get("b") == [3.0, 4.0]
+    finally:
+        cache.close()
@@ -0,0 +1,21 @@
+import json
+
+from loguru import logger
+
+from src.utils.logging import construct_logger
+
+
+def test_log_file_is_written_without_a_queue(tmp_path):
+    path = tmp_path / "app.log"
+    try:
+        construct_logger(path=str(path), format="json")
+        logger.info("first")
+        # readable right away, not once the buffer fills or the process exits
+        lines = path.read_text().splitlines()
+        assert json.loads(lines[-1])["message"] == "first"
+
+        construct_logger(path=str(path), format="text")
+        logger.info("second")
+        assert "second" in path.read_text().splitlines()[-1]
+    finally:
+        construct_logger()
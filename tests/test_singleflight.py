@@ -0,0 +1,52 @@
+import asyncio
+
+from fastapi import FastAPI
+import httpx
+from loguru import logger
+
+from src.common.middleware import RequestContextMiddleware
+from src.services.concurrency import SingleFlight
+from src.services.metrics import STAGE_SECONDS
+from src.utils.logging import request_id
+from src.utils.metrics import timed
+
+
+def test_shared_call_times_every_request():
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+    singleflight = SingleFlight()
+
+    async def generate() -> str:
+        with timed(STAGE_SECONDS, "llm"):
+            await asyncio.sleep(0.2)
+        return "answer"
+
+    @app.get("/chat")
+    async def chat():
+        return {"answer": await singleflight.do("query", generate)}
+
+    records = []
+    sink = logger.add(
+        lambda message: records.append((str(message).strip(), request_id.get())),
+        format="{message}",
+    )
+
+    async def main():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            first = asyncio.create_task(
+                client.get("/chat", headers={"X-Request-ID": "first"})
+            )
+            await asyncio.sleep(0.05)
+            second = await client.get("/chat", headers={"X-Request-ID": "second"})
+            return await first, second
+
+    try:
+        first, second = asyncio.run(main())
+    finally:
+        logger.remove(sink)
+
+    assert singleflight.stats()["shared"] == 1
+    for response in (first, second):
+        assert response.json() == {"answer": "answer"}
+        assert "llm;dur=" in response.headers["Server-Timing"]
+    assert ("Sharing the in-flight call of request first", "second") in records